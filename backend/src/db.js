@@ -55,6 +55,12 @@ async function createIndexes() {
     
     // Index sur name (pour la recherche)
     await stationsCollection.createIndex({ name: 1 });
+
+    // Voisinage et pistes de rééquilibrage précalculés par le batch
+    // (conservés par le batch quand il remplace ces collections)
+    await db.collection('station_neighbors').createIndex({ stationCode: 1 });
+    await db.collection('rebalancing_hints').createIndex({ hour: 1, emptyRate: -1 });
+    await db.collection('daily_stats').createIndex({ date: -1 });
     
     console.log('✅ Indexes created successfully');
   } catch (error) {
@@ -2,6 +2,16 @@ const express = require('express');
 const router = express.Router();
 const { getDB } = require('./db');
 
+/**
+ * Document de service précalculé par les pipelines (collection serving) :
+ * live:* écrits à chaque tick par le streaming, batch:* à chaque run du batch.
+ * null si absent (avant le premier tick ou run) : les routes interrogent alors
+ * directement les collections
+ */
+async function getServing(db, id) {
+  return db.collection('serving').findOne({ _id: id });
+}
+
 /**
  * GET /api/stations
  * Récupérer toutes les stations avec pagination
@@ -46,6 +56,11 @@ router.get('/stations/top', async (req, res) => {
     const db = getDB();
     const limit = parseInt(req.query.limit) || 10;
 
+    const serving = await getServing(db, 'live:top');
+    if (serving && limit <= serving.limit) {
+      return res.json({ success: true, data: serving.data.slice(0, limit) });
+    }
+
     const stations = await db.collection('stations')
       .find({ isInstalled: true })
       .sort({ numBikesAvailable: -1 })
@@ -67,6 +82,13 @@ router.get('/stations/critical', async (req, res) => {
     const db = getDB();
     const threshold = parseInt(req.query.threshold) || 3;
 
+    const serving = await getServing(db, 'live:critical');
+    if (serving && threshold <= serving.threshold) {
+      const data = serving.data.filter(s =>
+        s.numBikesAvailable <= threshold || s.numDocksAvailable <= threshold);
+      return res.json({ success: true, data });
+    }
+
     const stations = await db.collection('stations')
       .find({
         isInstalled: true,
@@ -109,6 +131,49 @@ router.get('/stations/:id', async (req, res) => {
   }
 });
 
+/**
+ * GET /api/stations/:id/nearby
+ * Stations voisines avec des vélos disponibles (voisinage précalculé par le batch,
+ * disponibilités temps réel) ; paramètres : minBikes (défaut 1), limit (défaut 5)
+ */
+router.get('/stations/:id/nearby', async (req, res) => {
+  try {
+    const db = getDB();
+    const stationCode = req.params.id;
+    const minBikes = parseInt(req.query.minBikes) || 1;
+    const limit = parseInt(req.query.limit) || 5;
+
+    const entry = await db.collection('station_neighbors')
+      .findOne({ stationCode: stationCode });
+
+    if (!entry) {
+      return res.status(404).json({
+        success: false,
+        error: 'Station not found'
+      });
+    }
+
+    const codes = entry.neighbors.map(n => n.stationCode);
+    const live = await db.collection('stations')
+      .find({
+        stationCode: { $in: codes },
+        isInstalled: true,
+        numBikesAvailable: { $gte: minBikes }
+      })
+      .toArray();
+
+    const byCode = new Map(live.map(s => [s.stationCode, s]));
+    const nearby = entry.neighbors
+      .filter(n => byCode.has(n.stationCode))
+      .slice(0, limit)
+      .map(n => ({ ...byCode.get(n.stationCode), distanceM: Math.round(n.distanceM) }));
+
+    res.json({ success: true, data: nearby, count: nearby.length });
+  } catch (error) {
+    res.status(500).json({ success: false, error: error.message });
+  }
+});
+
 /**
  * GET /api/stats
  * Récupérer les statistiques globales
@@ -117,6 +182,12 @@ router.get('/stats', async (req, res) => {
   try {
     const db = getDB();
 
+    const serving = await getServing(db, 'live:stats');
+    if (serving) {
+      const { totalCapacity, ...data } = serving.data;
+      return res.json({ success: true, data });
+    }
+
     const stats = await db.collection('stations').aggregate([
       {
         $match: { isInstalled: true }
@@ -167,6 +238,27 @@ router.get('/stats', async (req, res) => {
   }
 });
 
+/**
+ * GET /api/stats/cells
+ * Agrégats par cellule de grille (environ 1 km) : vélos, places, occupation,
+ * stations vides / pleines ; précalculés par le streaming à chaque tick
+ */
+router.get('/stats/cells', async (req, res) => {
+  try {
+    const db = getDB();
+    const serving = await getServing(db, 'live:cells');
+
+    res.json({
+      success: true,
+      data: serving ? serving.data : [],
+      timestamp: serving ? serving.timestamp : null,
+      count: serving ? serving.data.length : 0
+    });
+  } catch (error) {
+    res.status(500).json({ success: false, error: error.message });
+  }
+});
+
 // Routes pour les données batch
 
 /**
@@ -203,6 +295,12 @@ router.get('/batch/incidents', async (req, res) => {
 router.get('/batch/empty-full', async (req, res) => {
   try {
     const db = getDB();
+
+    const serving = await getServing(db, 'batch:empty_full');
+    if (serving) {
+      return res.json({ success: true, data: serving.data, count: serving.data.length });
+    }
+
     const emptyFullStations = await db.collection('stations_empty_full_tracking')
       .find({})
       .sort({ emptyPercentage: -1 })
@@ -231,11 +329,16 @@ router.get('/batch/daily-stats', async (req, res) => {
   try {
     const db = getDB();
     const { date } = req.query;
+
+    const serving = date ? null : await getServing(db, 'batch:daily_stats');
+    if (serving) {
+      return res.json({ success: true, data: serving.data, count: serving.data.length });
+    }
     
     const query = date ? { date } : {};
     const dailyStats = await db.collection('daily_stats')
       .find(query)
-      .sort({ _id: -1 })
+      .sort({ date: -1 })
       .limit(30)
       .toArray();
     
@@ -283,4 +386,39 @@ router.get('/batch/aggregated', async (req, res) => {
   }
 });
 
+/**
+ * GET /api/batch/rebalancing
+ * Pistes de rééquilibrage : stations souvent vides à une heure donnée et voisines
+ * souvent pleines à la même heure ; paramètre : hour (0-23, défaut : heure courante)
+ */
+router.get('/batch/rebalancing', async (req, res) => {
+  try {
+    const db = getDB();
+    const hour = req.query.hour !== undefined ? parseInt(req.query.hour) : new Date().getHours();
+
+    const serving = await getServing(db, 'batch:rebalancing:' + hour);
+    if (serving) {
+      return res.json({ success: true, data: serving.data, count: serving.data.length });
+    }
+
+    const hints = await db.collection('rebalancing_hints')
+      .find({ hour })
+      .sort({ emptyRate: -1 })
+      .limit(100)
+      .toArray();
+
+    res.json({
+      success: true,
+      data: hints,
+      count: hints.length
+    });
+  } catch (error) {
+    console.error('Error fetching rebalancing hints:', error);
+    res.status(500).json({
+      success: false,
+      error: 'Failed to fetch rebalancing hints'
+    });
+  }
+});
+
 module.exports = router;
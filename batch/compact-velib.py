@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Compaction d'une journée de l'archive brute Vélib
+Fusionne les petits fichiers JSON de /velib/raw/<date>/ (ancien archivage, un
+fichier par tick) et les fichiers Parquet écrits par le streaming dans
+/velib/archive/date=<date>/ en un seul fichier Parquet par heure
+
+La liste des fichiers lus est figée avant la lecture : seuls ces fichiers
+sont remplacés, ceux que le streaming écrit pendant la compaction restent en
+place. Les fichiers JSON lus sont supprimés une fois la partition Parquet en
+place (sinon le pipeline batch lirait ces données deux fois) ; --keep-json
+les conserve, par exemple pour vérifier la compaction avant de les supprimer.
+
+Usage : spark-submit compact-velib.py <YYYY-MM-DD> [--keep-json]
+"""
+
+from __future__ import print_function, unicode_literals
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import col, hour
+from datetime import datetime
+import sys
+
+from raw_schema import RAW_COLUMNS, RAW_SCHEMA
+
+HDFS_INPUT_PATH = "hdfs://namenode:8020/velib/raw/"
+HDFS_ARCHIVE_PATH = "hdfs://namenode:8020/velib/archive/"
+HDFS_STAGING_PATH = "hdfs://namenode:8020/velib/archive/_compacting/"
+COMPRESSION = "zstd"
+
+
+def initialize_spark():
+    """
+    Initialiser la session Spark pour la compaction
+    """
+    spark = SparkSession.builder \
+        .appName("VelibArchiveCompaction") \
+        .config("spark.hadoop.fs.defaultFS", "hdfs://namenode:8020") \
+        .getOrCreate()
+    
+    spark.sparkContext.setLogLevel("WARN")
+    return spark
+
+
+def hadoop_fs(spark, path):
+    """
+    Retourner (FileSystem Hadoop, Path) pour manipuler les répertoires HDFS
+    """
+    jvm = spark._jvm
+    hpath = jvm.org.apache.hadoop.fs.Path(path)
+    return hpath.getFileSystem(spark._jsc.hadoopConfiguration()), hpath
+
+
+def list_data_files(spark, path, extension):
+    """
+    Fichiers de données sous path (récursif), hors fichiers et répertoires cachés
+    ou temporaires (_temporary, _SUCCESS, .tmp...)
+    """
+    fs, hpath = hadoop_fs(spark, path)
+    if not fs.exists(hpath):
+        return []
+    root = hpath.toUri().getPath().rstrip("/")
+    files = []
+    iterator = fs.listFiles(hpath, True)
+    while iterator.hasNext():
+        file_path = iterator.next().getPath()
+        relative = file_path.toUri().getPath()[len(root) + 1:].split("/")
+        if file_path.getName().endswith(extension) and not any(p.startswith(("_", ".")) for p in relative):
+            files.append(file_path.toString())
+    return sorted(files)
+
+
+def read_day(spark, date):
+    """
+    Lire toutes les données brutes d'une journée (JSON et Parquet) avec le schéma fixe
+    Retourne (DataFrame ou None, fichiers JSON lus, fichiers Parquet lus)
+    """
+    frames = []
+    
+    json_files = list_data_files(spark, HDFS_INPUT_PATH + date, ".json")
+    if json_files:
+        print("📂 JSON input: %d files in %s" % (len(json_files), HDFS_INPUT_PATH + date))
+        frames.append(spark.read.schema(RAW_SCHEMA).json(json_files))
+    
+    parquet_files = list_data_files(spark, HDFS_ARCHIVE_PATH + "date=" + date, ".parquet")
+    if parquet_files:
+        print("📂 Parquet input: %d files in %s" % (len(parquet_files), HDFS_ARCHIVE_PATH + "date=" + date))
+        frames.append(spark.read.schema(RAW_SCHEMA).parquet(*parquet_files).select(*RAW_COLUMNS))
+    
+    if not frames:
+        return None, json_files, parquet_files
+    
+    df = frames[0]
+    for other in frames[1:]:
+        df = df.unionByName(other)
+    return df, json_files, parquet_files
+
+
+def delete_files(spark, files):
+    """
+    Supprimer une liste de fichiers HDFS
+    """
+    for path in files:
+        fs, hpath = hadoop_fs(spark, path)
+        if fs.exists(hpath) and not fs.delete(hpath, False):
+            raise IOError("Delete failed: " + path)
+
+
+def compact_day(spark, date, delete_json=True):
+    """
+    Réécrire la journée en un fichier Parquet par heure puis remplacer les fichiers lus
+    """
+    df, json_files, parquet_files = read_day(spark, date)
+    if df is None:
+        print("⚠️ No data for " + date)
+        return False
+    
+    staging = HDFS_STAGING_PATH + "date=" + date
+    target = HDFS_ARCHIVE_PATH + "date=" + date
+    
+    print("💾 Writing compacted partition to staging: " + staging)
+    # Un même tick (stationCode, timestamp) relu avec --keep-json sur une journée déjà
+    # compactée : gardé une fois. Une même lecture relevée à plusieurs ticks est gardée :
+    # le batch en tire la présence de la station (durées d'état)
+    df.filter(col("stationCode").isNotNull()) \
+        .dropDuplicates(["stationCode", "timestamp"]) \
+        .withColumn("hour", hour(col("timestamp"))) \
+        .repartition("hour") \
+        .write \
+        .mode("overwrite") \
+        .option("compression", COMPRESSION) \
+        .partitionBy("hour") \
+        .parquet(staging)
+    
+    # Les fichiers compactés rejoignent la partition, puis seuls les fichiers lus sont
+    # supprimés : rien n'est perdu si la compaction s'arrête en route, mais une lecture
+    # concurrente peut voir les deux versions d'un tick (une nouvelle compaction les
+    # dédoublonne). Les fichiers écrits par le streaming depuis read_day restent en place
+    fs, target_path = hadoop_fs(spark, target)
+    jvm = spark._jvm
+    for path in list_data_files(spark, staging, ".parquet"):
+        _, source = hadoop_fs(spark, path)
+        destination = jvm.org.apache.hadoop.fs.Path(target + "/" + source.getParent().getName(), source.getName())
+        fs.mkdirs(destination.getParent())
+        if not fs.rename(source, destination):
+            raise IOError("Rename failed: " + path + " -> " + destination.toString())
+    delete_files(spark, parquet_files)
+    fs.delete(hadoop_fs(spark, staging)[1], True)
+    print("✅ Partition compacted: %s (%d files replaced)" % (target, len(parquet_files)))
+    
+    if delete_json and json_files:
+        delete_files(spark, json_files)
+        print("🗑️ JSON files removed: %d in %s" % (len(json_files), HDFS_INPUT_PATH + date))
+    return True
+
+
+def main():
+    """
+    Point d'entrée principal
+    """
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not args:
+        print("Usage: compact-velib.py <YYYY-MM-DD> [--keep-json]")
+        sys.exit(1)
+    
+    date = args[0]
+    if date == datetime.now().strftime("%Y-%m-%d"):
+        print("⚠️ Compacting the current day: files flushed afterwards by the streaming will stay separate")
+    
+    spark = initialize_spark()
+    try:
+        compact_day(spark, date, delete_json="--keep-json" not in sys.argv)
+    except Exception as e:
+        print("❌ Compaction failed: " + str(e))
+        sys.exit(1)
+    finally:
+        spark.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Profils d'exécution Spark du batch (--profile / SPARK_PROFILE)
+
+- local-dev   : poste de développement, local[*], petites partitions
+- single-node : une machine (docker-compose), driver qui porte tout le calcul
+- cluster     : spark-submit sur le cluster (workers de 2 Go / 2 cœurs)
+
+Tous activent AQE (fusion des petites partitions, découpage des jointures
+déséquilibrées), Kryo et l'ordonnanceur FAIR (journées du rattrapage traitées
+en parallèle). Le nombre de partitions de shuffle est calculé à partir du
+volume des données d'entrée (input_bytes_per_partition), borné par le profil,
+puis ajusté à l'exécution par AQE. output_buckets : nombre de
+fichiers par sortie (ou par date), chaque fichier ne contenant qu'un sous-ensemble
+des stations, trié par stationCode.
+
+Les valeurs passées à spark-submit (--conf, --master) restent prioritaires.
+"""
+
+DEFAULT_PROFILE = "cluster"
+
+MB = 1024 * 1024
+
+COMMON_CONF = {
+    "spark.serializer": "org.apache.spark.serializer.KryoSerializer",
+    "spark.kryoserializer.buffer.max": "256m",
+    "spark.sql.adaptive.enabled": "true",
+    "spark.sql.adaptive.coalescePartitions.enabled": "true",
+    "spark.sql.adaptive.skewJoin.enabled": "true",
+    "spark.sql.adaptive.skewJoin.skewedPartitionFactor": "5",
+    "spark.sql.adaptive.skewJoin.skewedPartitionThresholdInBytes": "128m",
+    "spark.sql.sources.partitionOverwriteMode": "dynamic",
+    # Rattrapage : les journées traitées en parallèle se partagent les exécuteurs
+    "spark.scheduler.mode": "FAIR",
+}
+
+EXECUTION_PROFILES = {
+    "local-dev": {
+        "master": "local[*]",
+        "conf": {
+            "spark.driver.memory": "2g",
+            "spark.sql.adaptive.advisoryPartitionSizeInBytes": "16m",
+            "spark.sql.autoBroadcastJoinThreshold": "32m",
+        },
+        "input_bytes_per_partition": 8 * MB,
+        "min_partitions": 2,
+        "max_partitions": 32,
+        "output_buckets": 1,
+    },
+    "single-node": {
+        "master": "local[*]",
+        "conf": {
+            "spark.driver.memory": "6g",
+            "spark.sql.adaptive.advisoryPartitionSizeInBytes": "64m",
+            "spark.sql.autoBroadcastJoinThreshold": "64m",
+        },
+        "input_bytes_per_partition": 16 * MB,
+        "min_partitions": 8,
+        "max_partitions": 256,
+        "output_buckets": 4,
+    },
+    "cluster": {
+        "master": None,
+        "conf": {
+            "spark.executor.memory": "1536m",
+            "spark.executor.cores": "2",
+            "spark.memory.fraction": "0.7",
+            "spark.sql.adaptive.advisoryPartitionSizeInBytes": "64m",
+            "spark.sql.autoBroadcastJoinThreshold": "32m",
+        },
+        "input_bytes_per_partition": 16 * MB,
+        "min_partitions": 16,
+        "max_partitions": 2000,
+        "output_buckets": 8,
+    },
+}
+
+
+def get_profile(name):
+    if name not in EXECUTION_PROFILES:
+        raise ValueError("Unknown Spark profile: " + str(name) + " (" + ", ".join(sorted(EXECUTION_PROFILES)) + ")")
+    return EXECUTION_PROFILES[name]
+
+
+def configure(builder, name, submitted=None):
+    """
+    Appliquer un profil à un SparkSession.Builder
+    submitted : SparkConf des propriétés passées à spark-submit, jamais écrasées
+    """
+    profile = get_profile(name)
+    conf = dict(COMMON_CONF)
+    conf.update(profile["conf"])
+    if profile["master"]:
+        conf["spark.master"] = profile["master"]
+    for key, value in sorted(conf.items()):
+        if submitted is None or not submitted.contains(key):
+            builder = builder.config(key, value)
+    return builder
+
+
+def shuffle_partitions(name, input_bytes):
+    """Nombre de partitions de shuffle pour input_bytes octets en entrée, dans les bornes du profil"""
+    profile = get_profile(name)
+    wanted = -(-int(input_bytes or 0) // profile["input_bytes_per_partition"])
+    if wanted < profile["min_partitions"]:
+        return profile["min_partitions"]
+    if wanted > profile["max_partitions"]:
+        return profile["max_partitions"]
+    return wanted
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Schéma des données brutes archivées par le streaming (documents de transform)
+Partagé par le pipeline batch et le job de compaction
+timestamp : heure du tick ; lastUpdate : heure de la lecture à la source ;
+prevSeen : tick précédent où la station était présente (archive dédoublonnée,
+voir streaming/dedup.py) ; les deux sont absents des archives plus anciennes
+"""
+
+from pyspark.sql.types import (ArrayType, BooleanType, DoubleType, IntegerType,
+                               StringType, StructField, StructType)
+
+RAW_SCHEMA = StructType([
+    StructField("stationCode", StringType(), True),
+    StructField("name", StringType(), True),
+    StructField("capacity", IntegerType(), True),
+    StructField("numBikesAvailable", IntegerType(), True),
+    StructField("numDocksAvailable", IntegerType(), True),
+    StructField("numMechanicalBikes", IntegerType(), True),
+    StructField("numElectricBikes", IntegerType(), True),
+    StructField("numElectricInternalBatteryBikes", IntegerType(), True),
+    StructField("numElectricRemovableBatteryBikes", IntegerType(), True),
+    StructField("isInstalled", BooleanType(), True),
+    StructField("coordinates", ArrayType(DoubleType()), True),
+    StructField("timestamp", StringType(), True),
+    StructField("lastUpdate", StringType(), True),
+    StructField("prevSeen", StringType(), True),
+])
+
+RAW_COLUMNS = [f.name for f in RAW_SCHEMA.fields]
+
+# Archive Parquet du streaming : colonnes brutes + colonnes de partition (date=YYYY-MM-DD/hour=H)
+ARCHIVE_SCHEMA = StructType(RAW_SCHEMA.fields + [
+    StructField("date", StringType(), True),
+    StructField("hour", IntegerType(), True),
+])
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Index spatial des stations : grille régulière et k plus proches voisins
+
+Les stations (quelques milliers) tiennent en mémoire sur le driver : la
+grille est construite une fois, puis les voisins de chaque station sont
+cherchés dans les cellules voisines, anneau par anneau, jusqu'à ce que les
+k plus proches soient certains. Les distances sont des distances de grand
+cercle (haversine) en mètres.
+"""
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE = np.pi * EARTH_RADIUS_M / 180
+
+
+def haversine_m(lon1, lat1, lon2, lat2):
+    """Distance (mètres) entre deux points ou tableaux de points en degrés"""
+    lon1, lat1, lon2, lat2 = (np.radians(v) for v in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class StationGrid(object):
+    """Grille de cellules d'au moins cell_m mètres de côté sur les coordonnées (longitude, latitude)
+
+    La largeur des cellules en longitude est calculée à la latitude la plus
+    élevée : une cellule fait au moins cell_m mètres partout, et l'anneau r
+    autour d'une station contient toutes les stations à moins de r * cell_m.
+    """
+
+    def __init__(self, longitudes, latitudes, cell_m=500.0):
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.cell_m = float(cell_m)
+        max_lat = np.abs(self.latitudes).max() if len(self.latitudes) else 0.0
+        self.cell_lat = self.cell_m / METERS_PER_DEGREE
+        self.cell_lon = self.cell_m / (METERS_PER_DEGREE * max(np.cos(np.radians(max_lat)), 1e-6))
+        self.cells = {}
+        for i, cell in enumerate(zip(*self.cell_of(self.longitudes, self.latitudes))):
+            self.cells.setdefault(cell, []).append(i)
+        self.cells = dict((cell, np.array(idx, dtype=np.int64)) for cell, idx in self.cells.items())
+
+    def __len__(self):
+        return len(self.longitudes)
+
+    def cell_of(self, longitudes, latitudes):
+        return (np.floor(np.asarray(longitudes) / self.cell_lon).astype(np.int64).tolist(),
+                np.floor(np.asarray(latitudes) / self.cell_lat).astype(np.int64).tolist())
+
+    def _ring(self, cx, cy, r):
+        """Indices des stations des cellules à distance de Tchebychev exactement r de (cx, cy)"""
+        found = []
+        for dx in range(-r, r + 1):
+            for dy in ((-r, r) if abs(dx) != r else range(-r, r + 1)):
+                idx = self.cells.get((cx + dx, cy + dy))
+                if idx is not None:
+                    found.append(idx)
+        return found
+
+    def nearest(self, i, k, max_distance_m):
+        """(indices, distances) des k stations les plus proches de la station i, à moins de max_distance_m"""
+        cx, cy = int(self.longitudes[i] // self.cell_lon), int(self.latitudes[i] // self.cell_lat)
+        max_ring = int(np.ceil(max_distance_m / self.cell_m))
+        candidates = []
+        best = None
+        for r in range(max_ring + 1):
+            candidates.extend(self._ring(cx, cy, r))
+            idx = np.concatenate(candidates) if candidates else np.empty(0, dtype=np.int64)
+            idx = idx[idx != i]
+            distances = haversine_m(self.longitudes[i], self.latitudes[i], self.longitudes[idx], self.latitudes[idx])
+            keep = distances <= max_distance_m
+            idx, distances = idx[keep], distances[keep]
+            order = np.argsort(distances, kind='stable')[:k]
+            best = idx[order], distances[order]
+            # Les stations hors des anneaux parcourus sont à plus de r * cell_m
+            if len(order) == k and distances[order[-1]] <= r * self.cell_m:
+                break
+        return best
+
+    def knn(self, k, max_distance_m):
+        """Voisins de toutes les stations : liste de (indices, distances) dans l'ordre des stations"""
+        return [self.nearest(i, k, max_distance_m) for i in range(len(self))]
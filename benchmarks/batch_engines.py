@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Moteurs batch spark et duckdb sur le même historique synthétique : durée de
+bout en bout et parité des sorties
+
+Les deux moteurs lisent la même archive locale (generator.py) et écrivent
+dans deux répertoires distincts ; MongoDB est remplacé par le sink en mémoire
+de sinks.py. Chaque sortie commune (agrégations quotidiennes, incidents,
+journal d'état, suivi vide/plein, statistiques globales, patterns horaires,
+anomalies) est comparée ligne à ligne : mêmes colonnes, mêmes types, mêmes
+valeurs (réels à --tolerance près). Le nombre de stations des statistiques
+est une estimation HyperLogLog côté Spark, un compte exact côté DuckDB :
+l'écart toléré est --hll-tolerance.
+
+La durée Spark comprend le démarrage de la session (profil local-dev) et les
+étapes propres au moteur Spark (voisinage, rééquilibrage, prévision,
+esquisses, état incrémental), affichées à part.
+
+Avec --refresh-rate < 1, une seconde vérification (dedup_parity) compare, avec
+DuckDB, les sorties d'une archive complète (une ligne par station et par tick)
+et de la même archive dédoublonnée comme par le streaming (lectures nouvelles
+et prevSeen) : les durées d'état doivent être identiques. Les deux archives
+se prolongent le lendemain du dernier jour, au-delà de la plus longue
+absence d'une station, et seules les journées complètes sont comparées : la
+présence d'une station après sa dernière ligne archivée n'est connue qu'à sa
+ligne suivante (prevSeen).
+
+Usage : python benchmarks/batch_engines.py [--stations 1500] [--days 1] [--period 300]
+                                           [--format parquet] [--refresh-rate 1.0]
+                                           [--tolerance 1e-6] [--hll-tolerance 0.02] [--dropout-rate 0]
+                                           [--dedup]
+--refresh-rate < 1 : lectures répétées d'un tick à l'autre (déduplication sur lastUpdate).
+--dropout-rate : stations absentes de la réponse sur une série de ticks (trous NO_DATA).
+--dedup : les deux moteurs lisent l'archive dédoublonnée (comme écrite par le streaming).
+Code de sortie 1 si une sortie diffère.
+"""
+
+from __future__ import print_function
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pyarrow.dataset as ds
+
+from common import load_script, timed
+from generator import SyntheticFeed, write_history
+from sinks import MemoryClient
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Sorties communes aux deux moteurs et clés de tri des lignes
+OUTPUTS = (
+    ('daily_stats', ('stationCode', 'name', 'date')),
+    ('station_incidents', ('stationCode', 'date', 'incidentType')),
+    ('station_state_log', ('stationCode', 'date', 'start', 'state')),
+    ('state_durations', ('stationCode', 'name', 'date')),
+    ('offline_spans', ('stationCode', 'start')),
+    ('empty_full_tracking', ('stationCode', 'name', 'date')),
+    ('problematic_stations', ('stationCode', 'name', 'date')),
+    ('daily_global_stats', ('date',)),
+    ('hourly_patterns', ('stationCode', 'name', 'hour')),
+    ('anomalies', ('stationCode', 'name')),
+)
+# Étapes de l'historique propres au moteur Spark (durée affichée à part)
+SPARK_ONLY_STAGES = ('compute_station_neighbors', 'compute_rebalancing_hints', 'train_forecast_models',
+                     'save_batch_state')
+
+
+def read_output(path, date_to=None):
+    """(schéma des fichiers, table pandas) d'une sortie Parquet, partitions date=... comprises ;
+    (None, None) pour une sortie vide (aucun fichier de données). date_to : lignes des dates
+    postérieures écartées"""
+    dataset = ds.dataset(path, format='parquet', partitioning='hive') if os.path.isdir(path) else None
+    if dataset is None or not dataset.files:
+        return None, None
+    schema = dict((f.name, str(f.type)) for f in ds.dataset(dataset.files[0], format='parquet').schema)
+    table = dataset.to_table().to_pandas()
+    if date_to is not None and 'date' in table.columns:
+        table = table[table['date'].astype(str).str[:10] <= date_to].reset_index(drop=True)
+    return schema, table
+
+
+def compare_output(spark_path, duckdb_path, keys, tolerance, hll_tolerance, labels=('spark', 'duckdb'),
+                   date_to=None):
+    """(lignes, différences) entre les deux versions d'une sortie (liste vide : identiques)"""
+    spark_schema, expected = read_output(spark_path, date_to)
+    duckdb_schema, actual = read_output(duckdb_path, date_to)
+    if expected is None or actual is None:
+        rows = tuple(len(t) if t is not None else 0 for t in (expected, actual))
+        return 0, [] if rows == (0, 0) else ['rows: %s %d, %s %d' % (labels[0], rows[0], labels[1], rows[1])]
+    if spark_schema != duckdb_schema:
+        return len(expected), ['schema: %s %s, %s %s' % (labels[0], spark_schema, labels[1], duckdb_schema)]
+    if len(expected) != len(actual):
+        return len(expected), ['rows: %s %d, %s %d' % (labels[0], len(expected), labels[1], len(actual))]
+    expected = expected.sort_values(list(keys)).reset_index(drop=True)
+    actual = actual.sort_values(list(keys)).reset_index(drop=True)[list(expected.columns)]
+
+    mismatches = []
+    for column in expected.columns:
+        a, b = expected[column], actual[column]
+        if column == 'totalStations':
+            same = np.abs(a - b) <= hll_tolerance * a
+        elif a.dtype.kind == 'f':
+            same = np.isclose(a, b, rtol=tolerance, atol=tolerance, equal_nan=True)
+        else:
+            same = np.array([x == y if not isinstance(x, np.ndarray) else np.array_equal(x, y)
+                             for x, y in zip(a.tolist(), b.tolist())], dtype=bool)
+        if not same.all():
+            i = int(np.argmin(same))
+            mismatches.append('%s: %d rows differ, first %r: %s %r, %s %r' % (
+                column, int((~same).sum()), dict((k, expected[k][i]) for k in keys), labels[0], a[i], labels[1], b[i]))
+    return len(expected), mismatches
+
+
+def run_spark(root, output, date_from=None, date_to=None, incremental=False):
+    """run_batch_pipeline (profil local-dev) ; retourne (statistiques globales, durées)"""
+    # Les exécuteurs importent sinks (MemoryClient) : même PYTHONPATH que le driver
+    os.environ['PYTHONPATH'] = os.pathsep.join(p for p in (BENCHMARKS_DIR, os.environ.get('PYTHONPATH')) if p)
+    from pyspark.sql import SparkSession
+    batch = load_script('batch/batch-velib.py', 'batch_under_test')
+    base = 'file://' + root + '/velib/'
+    batch.HDFS_INPUT_PATH = base + 'raw/'
+    batch.HDFS_ARCHIVE_PATH = base + 'archive/'
+    batch.HDFS_SNAPSHOT_PATH = base + 'snapshots/'
+    batch.HDFS_OUTPUT_PATH = 'file://' + output + '/'
+    batch.MongoClient = MemoryClient
+
+    spark_only = {'duration_s': 0.0}
+
+    def wrap(fn):
+        def stage(*args, **kwargs):
+            result, duration = timed(fn, *args, **kwargs)
+            spark_only['duration_s'] += duration
+            return result
+        return stage
+
+    for name in SPARK_ONLY_STAGES:
+        setattr(batch, name, wrap(getattr(batch, name)))
+
+    spark, session_s = timed(lambda: batch.configure(SparkSession.builder, 'local-dev').getOrCreate())
+    spark.sparkContext.setLogLevel('ERROR')
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, pipeline_s = timed(batch.run_batch_pipeline, spark, date_from, date_to, incremental,
+                                  profile='local-dev')
+            sketches = spark.read.parquet(batch.HDFS_OUTPUT_PATH + 'daily_sketches/')
+            stats = batch.compute_global_statistics(sketches).collect()[0].asDict()
+    finally:
+        spark.stop()
+    return stats, {'session_s': session_s, 'pipeline_s': pipeline_s,
+                   'spark_only_stages_s': spark_only['duration_s'], 'total_s': session_s + pipeline_s}
+
+
+def run_duckdb(root, output, date_from=None, date_to=None):
+    """run_local_pipeline ; retourne (statistiques globales, durées)"""
+    local = load_script('batch/local_engine.py', 'local_engine_under_test')
+    local.LOCAL_DATA_DIR = root
+    local.LOCAL_INPUT_PATH = os.path.join(root, 'velib', 'raw')
+    local.LOCAL_ARCHIVE_PATH = os.path.join(root, 'velib', 'archive')
+    local.LOCAL_SNAPSHOT_PATH = os.path.join(root, 'velib', 'snapshots')
+    local.LOCAL_OUTPUT_PATH = output
+    client = MemoryClient()
+    local.MongoClient = lambda *args, **kwargs: client
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, pipeline_s = timed(local.run_local_pipeline, date_from, date_to)
+    documents = client[local.MONGODB_DB][local.MONGODB_COLLECTION_GLOBAL_STATS].documents
+    return list(documents.values())[0], {'pipeline_s': pipeline_s, 'total_s': pipeline_s}
+
+
+def dedup_parity(root, n_stations, days, period_s, archive_format, refresh_rate, dropout_rate, tolerance):
+    """Sorties DuckDB des journées complètes, archive complète contre archive dédoublonnée
+    (même flux) ; retourne (lignes archivées par archive, part du temps sans données, différences)"""
+    n_days = max(1, int(math.ceil(days)))
+    date_to = (datetime.date(2024, 1, 15) + datetime.timedelta(days=n_days - 1)).isoformat()
+    rows, outputs = {}, {}
+    for name, dedup in (('full', False), ('dedup', True)):
+        feed = SyntheticFeed(n_stations, refresh_rate=refresh_rate, dropout_rate=dropout_rate)
+        extra_ticks = feed.dropout_ticks[1] + 1 if dropout_rate else 1
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows[name] = write_history(os.path.join(root, name), feed, n_days, period_s, archive_format,
+                                       start='2024-01-15', dedup=dedup, extra_ticks=extra_ticks)
+        outputs[name] = os.path.join(root, name + '-output')
+        # Intervalle des journées complètes : la partition du lendemain est lue pour leur fin
+        run_duckdb(os.path.join(root, name), outputs[name], '2024-01-15', date_to)
+
+    mismatches = {}
+    for output, keys in OUTPUTS:
+        _, m = compare_output(os.path.join(outputs['full'], output), os.path.join(outputs['dedup'], output),
+                              keys, tolerance, 0.0, labels=('full', 'dedup'), date_to=date_to)
+        if m:
+            mismatches[output] = m
+    _, durations = read_output(os.path.join(outputs['dedup'], 'state_durations'), date_to)
+    no_data_share = float(durations['noDataSeconds'].sum() /
+                          (durations['noDataSeconds'].sum() + durations['observedSeconds'].sum()))
+    return rows, no_data_share, mismatches
+
+
+def run(n_stations, days, period_s, archive_format, refresh_rate, tolerance, hll_tolerance, dropout_rate=0.0,
+        dedup=False):
+    root = tempfile.mkdtemp(prefix='velib-engines-')
+    try:
+        feed = SyntheticFeed(n_stations, refresh_rate=refresh_rate, dropout_rate=dropout_rate)
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = write_history(root, feed, days, period_s, archive_format, dedup=dedup)
+        spark_output = os.path.join(root, 'spark')
+        duckdb_output = os.path.join(root, 'duckdb')
+        duckdb_stats, duckdb_timings = run_duckdb(root, duckdb_output)
+        spark_stats, spark_timings = run_spark(root, spark_output)
+
+        outputs, rows_out = {}, {}
+        for name, keys in OUTPUTS:
+            rows_out[name], outputs[name] = compare_output(os.path.join(spark_output, name), os.path.join(duckdb_output, name),
+                                           keys, tolerance, hll_tolerance)
+        global_stats = []
+        for key, expected in spark_stats.items():
+            value = duckdb_stats.get(key)
+            if key == 'totalStations':
+                same = abs(expected - value) <= hll_tolerance * expected
+            elif isinstance(expected, float):
+                same = value is not None and np.isclose(expected, value, rtol=tolerance, atol=tolerance)
+            else:
+                same = str(expected) == str(value)
+            if not same:
+                global_stats.append('%s: spark %r, duckdb %r' % (key, expected, value))
+        outputs['global_stats'] = global_stats
+        
+        dedup_result = None
+        if refresh_rate < 1:
+            dedup_rows, no_data_share, dedup_mismatches = dedup_parity(
+                os.path.join(root, 'dedup-parity'), n_stations, days, period_s, archive_format, refresh_rate,
+                dropout_rate, tolerance)
+            dedup_result = {'rows': dedup_rows, 'no_data_share': no_data_share, 'parity': not dedup_mismatches,
+                            'mismatches': dedup_mismatches}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        'stations': n_stations,
+        'days': days,
+        'period_s': period_s,
+        'format': archive_format,
+        'refresh_rate': refresh_rate,
+        'dropout_rate': dropout_rate,
+        'dedup': dedup,
+        'rows': rows,
+        'spark': spark_timings,
+        'duckdb': duckdb_timings,
+        'speedup': spark_timings['total_s'] / duckdb_timings['total_s'],
+        'outputs': rows_out,
+        'parity': not any(outputs.values()),
+        'mismatches': dict((name, m) for name, m in outputs.items() if m),
+        'dedup_parity': dedup_result,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stations', type=int, default=1500)
+    parser.add_argument('--days', type=float, default=1)
+    parser.add_argument('--period', type=int, default=300)
+    parser.add_argument('--format', choices=('parquet', 'snapshot', 'json'), default='parquet')
+    parser.add_argument('--refresh-rate', type=float, default=1.0)
+    parser.add_argument('--tolerance', type=float, default=1e-6)
+    parser.add_argument('--hll-tolerance', type=float, default=0.02)
+    parser.add_argument('--dropout-rate', type=float, default=0.0)
+    parser.add_argument('--dedup', action='store_true')
+    args = parser.parse_args()
+    result = run(args.stations, args.days, args.period, args.format, args.refresh_rate, args.tolerance,
+                 args.hll_tolerance, args.dropout_rate, args.dedup)
+    print(json.dumps(result, indent=2, default=str))
+    dedup_parity_ok = result['dedup_parity'] is None or result['dedup_parity']['parity']
+    sys.exit(0 if result['parity'] and dedup_parity_ok else 1)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Nombre de jobs / stages Spark et durée de run_batch_pipeline sur une archive synthétique locale
+
+Les écritures HDFS vont dans un répertoire temporaire ; write_to_mongodb est
+remplacé par un collect() (même travail Spark, sans MongoDB).
+
+Usage : python benchmarks/batch_jobs.py [n_stations] [n_ticks] [--script batch/batch-velib.py] [--json]
+  --json : archive au format JSON (/velib/raw/<date>/), pour les anciennes versions du pipeline
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+
+from common import evolve_records, load_script, sample_records, timed
+
+
+def generate_archive(root, n_stations, n_ticks, period_s=30, as_json=False, day='2024-01-15'):
+    """Écrire n_ticks ticks d'une journée sous root (archive Parquet ou JSON par tick)"""
+    streaming = load_script('streaming/streaming-velib.py')
+    from archive import LocalWriter, ParquetArchiver
+    rng = random.Random(0)
+    records = sample_records(n_stations)
+    archiver = ParquetArchiver(LocalWriter(root), '/velib/archive', flush_rows=10 ** 9, flush_seconds=10 ** 9)
+    for t in range(n_ticks):
+        seconds = t * period_s
+        timestamp = '%sT%02d:%02d:%02d' % (day, seconds // 3600 % 24, seconds // 60 % 60, seconds % 60)
+        columns = streaming.transform_batch(evolve_records(records, rng), timestamp=timestamp)
+        if as_json:
+            path = os.path.join(root, 'velib', 'raw', day, 'batch_%06d.json' % t)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                for row in streaming.columns_to_rows(columns):
+                    f.write(json.dumps(row) + '\n')
+        else:
+            archiver.add(columns)
+    archiver.flush()
+
+
+def run(script, n_stations, n_ticks, as_json=False):
+    from pyspark.sql import SparkSession
+    root = tempfile.mkdtemp(prefix='velib-bench-')
+    try:
+        generate_archive(root, n_stations, n_ticks, as_json=as_json)
+        batch = load_script(script, 'batch_under_test')
+        base = 'file://' + root + '/velib/'
+        batch.HDFS_INPUT_PATH = base + 'raw/'
+        batch.HDFS_ARCHIVE_PATH = base + 'archive/'
+        batch.HDFS_OUTPUT_PATH = base + 'processed/'
+        batch.HDFS_SNAPSHOT_PATH = base + 'snapshots/'
+        batch.write_to_mongodb = lambda df, collection_name, *args, **kwargs: len(df.collect())
+
+        spark = SparkSession.builder.master('local[*]').appName('VelibBatchBenchmark').getOrCreate()
+        spark.sparkContext.setLogLevel('ERROR')
+        try:
+            spark.sparkContext.setJobGroup('benchmark', 'run_batch_pipeline')
+            _, duration = timed(batch.run_batch_pipeline, spark)
+            tracker = spark.sparkContext.statusTracker()
+            jobs = list(tracker.getJobIdsForGroup('benchmark'))
+            # Les versions récentes du pipeline définissent leur propre groupe de jobs
+            if hasattr(batch, 'SPARK_JOB_GROUP'):
+                jobs += tracker.getJobIdsForGroup(batch.SPARK_JOB_GROUP)
+            stages = set()
+            for job_id in jobs:
+                info = tracker.getJobInfo(job_id)
+                if info is not None:
+                    stages.update(info.stageIds)
+        finally:
+            spark.stop()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {
+        'script': script,
+        'stations': n_stations,
+        'ticks': n_ticks,
+        'rows': n_stations * n_ticks,
+        'duration_s': duration,
+        'spark_jobs': len(jobs),
+        'spark_stages': len(stages),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('stations', nargs='?', type=int, default=500)
+    parser.add_argument('ticks', nargs='?', type=int, default=120)
+    parser.add_argument('--script', default='batch/batch-velib.py')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+    print(json.dumps(run(args.script, args.stations, args.ticks, args.json), indent=2))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Utilitaires partagés par les scripts de benchmark
+"""
+
+import importlib.util
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_script(relative_path, name=None):
+    """
+    Charger un script du projet (streaming-velib.py, batch-velib.py) comme module
+    Les noms de fichiers contiennent un tiret et ne sont pas importables directement
+    """
+    path = os.path.join(ROOT_DIR, relative_path)
+    script_dir = os.path.dirname(path)
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    name = name or os.path.splitext(os.path.basename(path))[0].replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def sample_records(n_stations, seed=0):
+    """
+    Générer une réponse factice de l'API JCDecaux v3 (même structure que /vls/v3/stations)
+    """
+    rng = random.Random(seed)
+    records = []
+    for i in range(n_stations):
+        capacity = rng.randint(10, 40)
+        bikes = rng.randint(0, capacity)
+        mechanical = rng.randint(0, bikes)
+        records.append({
+            'number': i + 1,
+            'contractName': 'lyon',
+            'name': 'STATION %05d' % (i + 1),
+            'position': {'latitude': 45.70 + rng.random() * 0.1, 'longitude': 4.80 + rng.random() * 0.1},
+            'status': 'OPEN' if rng.random() > 0.02 else 'CLOSED',
+            'lastUpdate': '2024-01-15T08:00:%02d.000+00:00' % rng.randint(0, 59),
+            'totalStands': {
+                'capacity': capacity,
+                'availabilities': {
+                    'bikes': bikes,
+                    'stands': capacity - bikes,
+                    'mechanicalBikes': mechanical,
+                    'electricalBikes': bikes - mechanical,
+                    'electricalInternalBatteryBikes': bikes - mechanical,
+                    'electricalRemovableBatteryBikes': 0,
+                },
+            },
+        })
+    return records
+
+
+def timed(fn, *args, **kwargs):
+    """Exécuter fn et retourner (résultat, durée en secondes)"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def evolve_records(records, rng):
+    """Faire évoluer les disponibilités d'une réponse factice d'un tick au suivant (marche aléatoire)"""
+    for r in records:
+        avail = r['totalStands']['availabilities']
+        capacity = r['totalStands']['capacity']
+        bikes = min(capacity, max(0, avail['bikes'] + rng.randint(-2, 2)))
+        mechanical = min(bikes, avail['mechanicalBikes'])
+        avail.update({
+            'bikes': bikes,
+            'stands': capacity - bikes,
+            'mechanicalBikes': mechanical,
+            'electricalBikes': bikes - mechanical,
+            'electricalInternalBatteryBikes': bikes - mechanical,
+        })
+    return records
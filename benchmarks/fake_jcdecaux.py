@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Faux serveur de l'API JCDecaux v3 (GET /stations?contract=...&apiKey=...)
+
+Sert des stations synthétiques par contrat avec une latence configurable,
+gère ETag / If-None-Match et peut injecter des erreurs 503 sur les premières
+requêtes d'un contrat pour exercer les retries du fetcher, ou répondre par un
+JSON tronqué pour les contrats de malformed.
+
+Usage : python benchmarks/fake_jcdecaux.py [port] [latence_s]
+puis   JCDECAUX_API_BASE=http://localhost:<port> python streaming/streaming-velib.py
+"""
+
+from __future__ import print_function
+import json
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from common import sample_records
+
+
+class FakeJCDecauxHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        api = self.server.api
+        url = urlparse(self.path)
+        contract = parse_qs(url.query).get('contract', [''])[0]
+        if url.path.rstrip('/').split('/')[-1] != 'stations' or not contract:
+            self.send_error(404)
+            return
+
+        time.sleep(api.latency)
+        with api.lock:
+            api.requests += 1
+            failures = api.failures.get(contract, 0)
+            if failures:
+                api.failures[contract] = failures - 1
+        if failures:
+            self.send_error(503)
+            return
+
+        body = api.payload(contract)
+        if contract in api.malformed:
+            body = body[:len(body) // 2]
+        etag = '"%08x"' % zlib.crc32(body)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeJCDecauxServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class FakeJCDecauxAPI(object):
+    """Serveur HTTP en tâche de fond ; base_url est à passer au fetcher"""
+
+    def __init__(self, stations_per_contract=300, latency=0.1, port=0):
+        self.stations_per_contract = stations_per_contract
+        self.latency = latency
+        self.failures = {}
+        self.malformed = set()
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._payloads = {}
+        self.server = FakeJCDecauxServer(('127.0.0.1', port), FakeJCDecauxHandler)
+        self.server.api = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def payload(self, contract):
+        with self.lock:
+            if contract not in self._payloads:
+                records = sample_records(self.stations_per_contract, seed=zlib.crc32(contract.encode()))
+                for r in records:
+                    r['contractName'] = contract
+                self._payloads[contract] = json.dumps(records).encode('utf-8')
+            return self._payloads[contract]
+
+    def refresh(self, contract=None):
+        """Invalider les payloads (nouvel ETag au prochain appel)"""
+        with self.lock:
+            if contract is None:
+                self._payloads.clear()
+            else:
+                self._payloads.pop(contract, None)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8099
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    api = FakeJCDecauxAPI(latency=latency, port=port).start()
+    print('Fake JCDecaux API on ' + api.base_url)
+    try:
+        api.thread.join()
+    except KeyboardInterrupt:
+        api.stop()
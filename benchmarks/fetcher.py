@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Durée d'un cycle de récupération multi-contrats contre le faux serveur JCDecaux :
+requêtes séquentielles (comportement de l'ancien fetch_data) vs ContractFetcher.
+
+Usage : python benchmarks/fetcher.py [n_contracts] [latence_s]
+"""
+
+from __future__ import print_function
+import json
+import os
+import sys
+import urllib.request
+
+from common import ROOT_DIR, timed
+from fake_jcdecaux import FakeJCDecauxAPI
+
+sys.path.insert(0, os.path.join(ROOT_DIR, 'streaming'))
+from fetcher import ContractFetcher  # noqa: E402
+
+
+def sequential_fetch(base_url, contracts):
+    records = []
+    for contract in contracts:
+        url = base_url + '/stations?contract=' + contract + '&apiKey=bench'
+        with urllib.request.urlopen(url, timeout=15) as resp:
+            records.extend(json.loads(resp.read()))
+    return records
+
+
+def run(n_contracts=30, latency=0.2):
+    contracts = ['contract%02d' % i for i in range(n_contracts)]
+    api = FakeJCDecauxAPI(latency=latency).start()
+    fetcher = ContractFetcher(contracts, 'bench', api.base_url, backoff=0.05)
+    try:
+        seq_records, seq_time = timed(sequential_fetch, api.base_url, contracts)
+        (records, _), cold_time = timed(fetcher.fetch)
+        (_, stats), warm_time = timed(fetcher.fetch)
+        # Une erreur 503 par contrat : chaque contrat est récupéré au 2e essai
+        api.refresh()
+        api.failures = dict((c, 1) for c in contracts)
+        (retry_records, retry_stats), retry_time = timed(fetcher.fetch)
+    finally:
+        fetcher.close()
+        api.stop()
+    assert len(records) == len(seq_records) == len(retry_records)
+    return {
+        'contracts': n_contracts,
+        'latency_s': latency,
+        'sequential_s': seq_time,
+        'async_cold_s': cold_time,
+        'async_not_modified_s': warm_time,
+        'not_modified': sum(1 for i in stats.values() if i['status'] == 'not_modified'),
+        'async_with_retry_s': retry_time,
+        'retried': sum(1 for i in retry_stats.values() if i['attempts'] > 1),
+    }
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    lat = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    print(json.dumps(run(n, lat), indent=2))
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Générateur de flux de stations synthétique (même structure que /vls/v3/stations)
+
+Les disponibilités suivent une marche aléatoire ; des incidents sont injectés
+avec les règles des détecteurs du batch, et comptés pour servir de vérité
+terrain :
+- OFFLINE          : pannes (status CLOSED) sur une série de ticks
+- BRUTAL_CHANGE    : saut de plus de 20 vélos entre deux ticks
+- CAPACITY_ANOMALY : stations de capacité 0 ou > 100
+- stations figées  : aucune variation (anomalies « peu de changements »)
+
+refresh_rate : probabilité qu'une station publie une nouvelle lecture à un
+tick (lastUpdate) ; sinon l'API renvoie la même lecture qu'au tick précédent,
+comme une station JCDecaux pas encore rafraîchie. Un changement de statut
+publie toujours une lecture.
+
+dropout_rate : probabilité qu'une station disparaisse de la réponse pour une
+série de ticks (dropout_ticks) ; le batch y voit un trou (NO_DATA).
+
+Usage : python benchmarks/generator.py <dossier> [--stations 1500] [--days 1] [--period 300]
+                                      [--format parquet|snapshot|json] [--start 2024-01-15]
+                                      [--refresh-rate 1.0] [--dropout-rate 0] [--dedup]
+Écrit une archive locale lisible par le batch (HDFS_*_PATH = file://<dossier>/velib/...).
+"""
+
+from __future__ import print_function
+import argparse
+import datetime
+import json
+import os
+import random
+
+from common import load_script, sample_records
+
+BRUTAL_CHANGE_THRESHOLD = 20
+
+
+class SyntheticFeed(object):
+    """Flux reproductible : tick() fait évoluer et retourne les enregistrements de toutes les stations
+
+    injected compte les incidents injectés (en observations, comme le batch) ;
+    la liste retournée est réutilisée d'un tick à l'autre (sans dropout_rate).
+    """
+
+    def __init__(self, n_stations, seed=0, contract='lyon', outage_rate=0.0005, outage_ticks=(5, 60),
+                 brutal_rate=0.0005, capacity_anomaly_rate=0.002, frozen_rate=0.01, refresh_rate=1.0,
+                 dropout_rate=0.0, dropout_ticks=(3, 30)):
+        self.rng = random.Random(seed)
+        self.refresh_rate = refresh_rate
+        self.dropout_rate = dropout_rate
+        self.dropout_ticks = dropout_ticks
+        self.dropouts = {}
+        self.records = sample_records(n_stations, seed)
+        self.outage_rate = outage_rate
+        self.outage_ticks = outage_ticks
+        self.brutal_rate = brutal_rate
+        self.outages = {}
+        self.frozen = set()
+        self.capacity_anomalies = set()
+        self.injected = {'OFFLINE': 0, 'BRUTAL_CHANGE': 0, 'CAPACITY_ANOMALY': 0}
+        self.ticks = 0
+        for i, r in enumerate(self.records):
+            r['contractName'] = contract
+            r['status'] = 'OPEN'
+            if self.rng.random() < frozen_rate:
+                self.frozen.add(i)
+            if self.rng.random() < capacity_anomaly_rate:
+                self.capacity_anomalies.add(i)
+                self._set_bikes(r, 0, 0 if self.rng.random() < 0.5 else 120)
+
+    def _set_bikes(self, record, bikes, capacity=None):
+        stands = record['totalStands']
+        if capacity is not None:
+            stands['capacity'] = capacity
+        capacity = stands['capacity']
+        bikes = min(capacity, max(0, bikes))
+        mechanical = min(bikes, stands['availabilities']['mechanicalBikes'])
+        stands['availabilities'].update({
+            'bikes': bikes,
+            'stands': capacity - bikes,
+            'mechanicalBikes': mechanical,
+            'electricalBikes': bikes - mechanical,
+            'electricalInternalBatteryBikes': bikes - mechanical,
+        })
+
+    def tick(self, timestamp=None):
+        rng = self.rng
+        last_update = (timestamp or datetime.datetime.now().isoformat())[:19] + '.000+00:00'
+        for i, r in enumerate(self.records):
+            # Station absente de la réponse : rien ne change jusqu'à son retour
+            if self.dropout_rate:
+                absent = self.dropouts.get(i, 0)
+                if absent == 0 and self.ticks and rng.random() < self.dropout_rate:
+                    absent = rng.randint(*self.dropout_ticks)
+                if absent:
+                    self.dropouts[i] = absent - 1
+                    continue
+                self.dropouts.pop(i, None)
+
+            # Pannes : une série de ticks CLOSED
+            status = r['status']
+            remaining = self.outages.get(i, 0)
+            if remaining == 0 and rng.random() < self.outage_rate:
+                remaining = rng.randint(*self.outage_ticks)
+            if remaining:
+                self.outages[i] = remaining - 1
+                r['status'] = 'CLOSED'
+            else:
+                self.outages.pop(i, None)
+                r['status'] = 'OPEN'
+            
+            # Station pas rafraîchie : même lecture (disponibilités et lastUpdate) qu'au tick
+            # précédent, une seule observation pour le batch qui dédoublonne sur lastUpdate
+            if self.ticks and r['status'] == status and self.refresh_rate < 1 and rng.random() >= self.refresh_rate:
+                continue
+            r['lastUpdate'] = last_update
+
+            capacity = r['totalStands']['capacity']
+            bikes = r['totalStands']['availabilities']['bikes']
+            if i not in self.frozen:
+                if capacity > BRUTAL_CHANGE_THRESHOLD + 1 and rng.random() < self.brutal_rate:
+                    target = 0 if bikes > capacity // 2 else capacity
+                    # Le premier tick n'a pas d'observation précédente
+                    if self.ticks and abs(target - bikes) > BRUTAL_CHANGE_THRESHOLD:
+                        self.injected['BRUTAL_CHANGE'] += 1
+                    bikes = target
+                else:
+                    bikes += rng.randint(-2, 2)
+                self._set_bikes(r, bikes)
+
+            if r['status'] == 'CLOSED':
+                self.injected['OFFLINE'] += 1
+            if i in self.capacity_anomalies:
+                self.injected['CAPACITY_ANOMALY'] += 1
+        self.ticks += 1
+        if self.dropouts:
+            return [r for i, r in enumerate(self.records) if i not in self.dropouts]
+        return self.records
+
+    def static_stations(self):
+        """Stations sans aucune variation (figées ou de capacité nulle), attendues par detect_anomalies"""
+        empty = set(i for i in self.capacity_anomalies if self.records[i]['totalStands']['capacity'] == 0)
+        return len(self.frozen | empty)
+
+
+def iter_ticks(feed, n_ticks, start, period_s):
+    """(timestamp ISO, enregistrements) pour n_ticks ticks à partir de start (datetime)"""
+    for t in range(n_ticks):
+        timestamp = (start + datetime.timedelta(seconds=t * period_s)).isoformat()
+        yield timestamp, feed.tick(timestamp)
+
+
+def write_history(root, feed, days=1, period_s=300, archive_format='parquet', start='2024-01-15', dedup=False,
+                  extra_ticks=0):
+    """Écrire days jours de ticks (plus extra_ticks) sous root/velib/ au format d'archive du streaming ;
+    retourne le nombre de lignes
+
+    dedup : n'archiver que les lectures nouvelles (avec prevSeen), comme le sink archive
+    du streaming (DEDUP_ENABLED)
+    """
+    streaming = load_script('streaming/streaming-velib.py')
+    from archive import LocalWriter, ParquetArchiver, SnapshotArchiver
+    from dedup import ReadingFilter
+    reading_filter = ReadingFilter(presence=True) if dedup else None
+    writer = LocalWriter(root)
+    if archive_format == 'snapshot':
+        archiver = SnapshotArchiver(writer, '/velib/snapshots', flush_rows=10 ** 9, flush_seconds=10 ** 9)
+    else:
+        archiver = ParquetArchiver(writer, '/velib/archive', flush_rows=10 ** 9, flush_seconds=10 ** 9)
+    n_ticks = int(days * 86400 // period_s) + extra_ticks
+    rows = 0
+    for t, (timestamp, records) in enumerate(iter_ticks(feed, n_ticks, datetime.datetime.strptime(start, '%Y-%m-%d'), period_s)):
+        columns = streaming.transform_batch(records, timestamp=timestamp)
+        if reading_filter is not None:
+            tick = columns
+            columns, _ = reading_filter.select(tick)
+            reading_filter.remember(columns)
+            reading_filter.record_tick(tick)
+        rows += len(columns['stationCode'])
+        if archive_format == 'json':
+            path = os.path.join(root, 'velib', 'raw', timestamp[:10], 'batch_%06d.json' % t)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                for row in streaming.columns_to_rows(columns):
+                    f.write(json.dumps(row) + '\n')
+        else:
+            archiver.add(columns)
+    archiver.flush()
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root')
+    parser.add_argument('--stations', type=int, default=1500)
+    parser.add_argument('--days', type=float, default=1)
+    parser.add_argument('--period', type=int, default=300)
+    parser.add_argument('--format', choices=('parquet', 'snapshot', 'json'), default='parquet')
+    parser.add_argument('--start', default='2024-01-15')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--refresh-rate', type=float, default=1.0)
+    parser.add_argument('--dropout-rate', type=float, default=0.0)
+    parser.add_argument('--dedup', action='store_true')
+    args = parser.parse_args()
+    feed = SyntheticFeed(args.stations, seed=args.seed, refresh_rate=args.refresh_rate,
+                         dropout_rate=args.dropout_rate)
+    rows = write_history(args.root, feed, args.days, args.period, args.format, args.start, args.dedup)
+    print(json.dumps({'rows': rows, 'injected': feed.injected}, indent=2))
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Sinks locaux pour les benchmarks : MongoDB et WebHDFS en mémoire
+
+MemoryClient remplace pymongo.MongoClient (même sous-ensemble d'API que les
+pipelines : bulk_write, insert_many, index, renommage). Les documents sont
+encodés en BSON comme par le vrai driver, pour que le coût de sérialisation
+côté client reste dans la mesure ; les opérations sont appliquées à un
+dictionnaire, sans réseau. MemoryWebHDFS remplace hdfs.InsecureClient.
+"""
+
+import contextlib
+import io
+
+import bson
+from pymongo import ReplaceOne, UpdateOne
+
+
+class BulkResult(object):
+    def __init__(self, inserted=0, matched=0, upserted=0, deleted=0):
+        self.inserted_count = inserted
+        self.deleted_count = deleted
+        self.matched_count = matched
+        self.modified_count = matched
+        self.upserted_count = upserted
+
+
+class MemoryCollection(object):
+    """Collection en mémoire ; stats compte les opérations et les octets BSON reçus"""
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.documents = {}
+        self.indexes = {'_id_': {'key': [('_id', 1)]}}
+        self.stats = {'ops': 0, 'bytes': 0}
+
+    def _key(self, filter_):
+        return tuple(sorted(filter_.items()))
+
+    def _receive(self, *documents):
+        self.stats['ops'] += 1
+        self.stats['bytes'] += sum(len(bson.encode(d)) for d in documents)
+
+    def insert_many(self, documents, ordered=True):
+        documents = list(documents)
+        for document in documents:
+            self._receive(document)
+            self.documents[('_n', len(self.documents))] = dict(document)
+        return BulkResult(inserted=len(documents))
+
+    def bulk_write(self, requests, ordered=True):
+        matched = upserted = 0
+        for op in requests:
+            # Attributs internes des opérations pymongo (filtre, document, upsert)
+            filter_, document = op._filter, op._doc
+            self._receive(filter_, document)
+            key = self._key(filter_)
+            current = self.documents.get(key)
+            if current is None:
+                upserted += 1
+                current = self.documents[key] = dict(filter_)
+            else:
+                matched += 1
+            if isinstance(op, ReplaceOne):
+                current.clear()
+                current.update(filter_, **document)
+            elif isinstance(op, UpdateOne):
+                current.update(document.get('$set', {}))
+                for field, value in document.get('$inc', {}).items():
+                    current[field] = current.get(field, 0) + value
+                for field, value in document.get('$max', {}).items():
+                    current[field] = max(current.get(field, value), value)
+        return BulkResult(matched=matched, upserted=upserted)
+
+    def delete_many(self, filter_):
+        # Seule forme utilisée par les pipelines : {champ: {'$in': [...]}}
+        (field, condition), = filter_.items()
+        keys = [k for k, d in self.documents.items() if d.get(field) in condition['$in']]
+        for key in keys:
+            del self.documents[key]
+        return BulkResult(deleted=len(keys))
+
+    def create_index(self, keys, name=None, unique=False, **kwargs):
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        name = name or '_'.join('%s_%s' % k for k in keys)
+        self.indexes[name] = {'key': list(keys), 'unique': unique}
+        return name
+
+    def index_information(self):
+        return dict(self.indexes)
+
+    def count_documents(self, filter_=None):
+        return len(self.documents)
+
+    def rename(self, new_name, dropTarget=False):
+        collections = self.database.collections
+        collections.pop(self.name, None)
+        self.name = new_name
+        collections[new_name] = self
+
+
+class MemoryDatabase(object):
+    def __init__(self, name):
+        self.name = name
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection(self, name)
+        return self.collections[name]
+
+    def list_collection_names(self):
+        return list(self.collections)
+
+    def create_collection(self, name, **options):
+        return self[name]
+
+    def drop_collection(self, name):
+        self.collections.pop(name, None)
+
+
+class MemoryClient(object):
+    """Même signature que MongoClient ; l'URI et les options sont ignorées"""
+
+    def __init__(self, uri=None, **kwargs):
+        self.databases = {}
+
+    def __getitem__(self, name):
+        if name not in self.databases:
+            self.databases[name] = MemoryDatabase(name)
+        return self.databases[name]
+
+    def stats(self):
+        """Opérations et octets reçus, par collection"""
+        return dict(('%s.%s' % (db.name, c.name), dict(c.stats))
+                    for db in self.databases.values() for c in db.collections.values())
+
+    def close(self):
+        pass
+
+
+class MemoryWebHDFS(object):
+    """Client WebHDFS en mémoire (write / status / read)"""
+
+    def __init__(self):
+        self.files = {}
+
+    def write(self, path, data=None, encoding=None, overwrite=False, **kwargs):
+        if encoding is not None and not isinstance(data, bytes):
+            data = data.encode(encoding)
+        if not overwrite and path in self.files:
+            raise IOError('File already exists: ' + path)
+        self.files[path] = data
+
+    def status(self, path, strict=True):
+        if path in self.files:
+            return {'length': len(self.files[path]), 'type': 'FILE'}
+        if strict:
+            raise IOError('File does not exist: ' + path)
+        return None
+
+    def read(self, path):
+        return contextlib.closing(io.BytesIO(self.files[path]))
+
+    def stats(self):
+        return {'files': len(self.files), 'bytes': sum(len(d) for d in self.files.values())}
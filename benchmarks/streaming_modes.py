@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Comparaison des moteurs du pipeline streaming : 'spark' (ancienne boucle,
+createDataFrame + filter + collect + count à chaque tick) et 'python'
+(transform en mémoire, sans JVM).
+
+Les sinks (MongoDB, HDFS) sont exclus : on mesure le démarrage et le coût
+de traitement d'un tick.
+
+Usage : python benchmarks/streaming_modes.py [n_stations] [ticks]
+"""
+
+from __future__ import print_function
+import json
+import sys
+
+from common import load_script, sample_records, timed
+
+
+def legacy_spark_tick(streaming, spark, records):
+    from pyspark.sql.functions import col
+    transformed = [streaming.transform(r) for r in records if streaming.transform(r)]
+    df = spark.createDataFrame(transformed).filter(col('stationCode').isNotNull())
+    rows = [r.asDict() for r in df.collect()]
+    df.count()
+    return rows
+
+
+def python_tick(streaming, records):
+    return streaming.transform_all(records)
+
+
+def run(n_stations=3000, ticks=5):
+    streaming = load_script('streaming/streaming-velib.py')
+    records = sample_records(n_stations)
+    results = {'stations': n_stations, 'ticks': ticks}
+
+    python_times = [timed(python_tick, streaming, records)[1] for _ in range(ticks)]
+    results['python'] = {'startup_s': 0.0, 'tick_s': python_times}
+
+    try:
+        from pyspark.sql import SparkSession
+    except ImportError:
+        print('⚠️ pyspark not installed, skipping spark engine')
+        return results
+
+    # Session locale sans spark.jars.packages : on mesure le coût de la JVM, pas du téléchargement
+    spark, startup = timed(lambda: SparkSession.builder.master('local[*]')
+                           .appName('VelibStreamingBenchmark').getOrCreate())
+    spark.sparkContext.setLogLevel('WARN')
+    try:
+        spark_times = [timed(legacy_spark_tick, streaming, spark, records)[1] for _ in range(ticks)]
+    finally:
+        spark.stop()
+    results['spark'] = {'startup_s': startup, 'tick_s': spark_times}
+    return results
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    t = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(json.dumps(run(n, t), indent=2))
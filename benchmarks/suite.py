@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Suite de benchmarks par étape, sur le flux synthétique de generator.py
+
+Streaming : latence par tick (moyenne, p50, p95, max) et débit (lignes/s) de
+transform, write_mongo, write_history, write_incidents, write_hdfs (JSON via
+WebHDFS) et des archiveurs Parquet / snapshot, avec les sinks en mémoire de
+sinks.py.
+
+Batch : durée et jobs / stages Spark de chaque étape de run_batch_pipeline
+(fonctions enveloppées par un chronomètre et un groupe de jobs), Spark local,
+HDFS dans un répertoire temporaire et MongoDB en mémoire sur les exécuteurs.
+Spark étant paresseux, une étape qui ne fait que construire un plan est
+quasi gratuite : le calcul est compté dans l'écriture qui le déclenche. Les
+incidents détectés par le batch sont comparés à ceux injectés par le générateur.
+
+Usage : python benchmarks/suite.py [--sizes 500,1500,5000] [--ticks 30]
+                                   [--batch-sizes 200,1000] [--days 1] [--period 300] [--format parquet]
+                                   [--skip-streaming] [--skip-batch]
+                                   [--output results.json] [--compare baseline.json] [--threshold 0.2]
+--compare : affiche le rapport de chaque mesure à la référence ; code de sortie 1
+si une mesure est plus lente de plus de threshold (20 % par défaut).
+"""
+
+from __future__ import print_function
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from common import load_script, timed
+from generator import SyntheticFeed, iter_ticks, write_history
+from sinks import MemoryClient, MemoryWebHDFS
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STREAMING_STAGES = (
+    'transform',
+    'write_mongo',
+    'write_history',
+    'write_incidents',
+    'write_hdfs',
+    'archive_parquet',
+    'archive_snapshot',
+)
+
+# Étapes de run_batch_pipeline (celles absentes d'une version du script sont ignorées)
+BATCH_STAGES = (
+    'read_raw_data_from_hdfs',
+    'prepare_station_timeline',
+    'compute_station_partials',
+    'rollup_daily_partials',
+    'rollup_station_hour_totals',
+    'compute_daily_aggregations',
+    'compute_hourly_patterns',
+    'detect_anomalies',
+    'detect_station_incidents',
+    'build_state_intervals',
+    'compute_state_durations',
+    'compute_offline_spans',
+    'track_empty_full_stations',
+    'compute_station_neighbors',
+    'compute_rebalancing_hints',
+    'train_forecast_models',
+    'compute_daily_sketches',
+    'compute_global_statistics',
+    'write_to_hdfs',
+    'write_to_mongodb',
+    'upsert_to_mongodb',
+    'save_batch_state',
+)
+
+
+def summarize(durations, rows):
+    """Latence par appel et débit d'une étape"""
+    ordered = sorted(durations)
+    total = sum(ordered)
+    return {
+        'calls': len(ordered),
+        'total_s': total,
+        'mean_s': total / len(ordered),
+        'p50_s': ordered[len(ordered) // 2],
+        'p95_s': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max_s': ordered[-1],
+        'rows_per_s': rows / total if total else None,
+    }
+
+
+def bench_streaming(n_stations, n_ticks, period_s=60):
+    """Chaque étape d'un tick du streaming, sur n_ticks ticks du flux synthétique"""
+    streaming = load_script('streaming/streaming-velib.py')
+    from archive import ParquetArchiver, SnapshotArchiver, WebHDFSWriter
+
+    streaming.MongoClient = MemoryClient
+    streaming.HDFS_ENABLED = True
+    hdfs = MemoryWebHDFS()
+    streaming._webhdfs_client = hdfs
+    # Horloge des archiveurs = temps du flux, pour que ARCHIVE_FLUSH_SECONDS s'applique comme en production
+    now = [0.0]
+    archivers = {
+        'archive_parquet': ParquetArchiver(WebHDFSWriter(hdfs), '/velib/archive', streaming.ARCHIVE_FLUSH_ROWS,
+                                           streaming.ARCHIVE_FLUSH_SECONDS, clock=lambda: now[0]),
+        'archive_snapshot': SnapshotArchiver(WebHDFSWriter(hdfs), '/velib/snapshots', streaming.ARCHIVE_FLUSH_ROWS,
+                                             streaming.ARCHIVE_FLUSH_SECONDS, clock=lambda: now[0]),
+    }
+
+    feed = SyntheticFeed(n_stations)
+    durations = dict((stage, []) for stage in STREAMING_STAGES)
+    rows_total = 0
+    start = datetime.datetime(2024, 1, 15, 8)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t, (timestamp, records) in enumerate(iter_ticks(feed, n_ticks, start, period_s)):
+            now[0] = t * period_s
+            columns, transform_s = timed(streaming.transform_batch, records, timestamp=timestamp)
+            rows, rows_s = timed(streaming.columns_to_rows, columns)
+            durations['transform'].append(transform_s + rows_s)
+            durations['write_mongo'].append(timed(streaming.write_mongo, rows)[1])
+            durations['write_history'].append(timed(streaming.write_history, columns)[1])
+            durations['write_incidents'].append(timed(streaming.write_incidents, columns)[1])
+            durations['write_hdfs'].append(timed(streaming.write_hdfs, rows, t)[1])
+            for stage, archiver in archivers.items():
+                durations[stage].append(timed(archiver.add, columns)[1])
+            rows_total += len(rows)
+        # Le flush final fait partie du coût d'archivage
+        for stage, archiver in archivers.items():
+            durations[stage][-1] += timed(archiver.flush)[1]
+        durations['write_history'][-1] += timed(streaming.flush_history)[1]
+
+    result = {
+        'stations': n_stations,
+        'ticks': n_ticks,
+        'rows': rows_total,
+        'stages': dict((stage, summarize(d, rows_total)) for stage, d in durations.items()),
+        'sinks': {'mongodb': streaming._mongo_writer.client.stats(), 'hdfs': hdfs.stats()},
+    }
+    return result
+
+
+def instrument(batch, spark, timings):
+    """Envelopper les étapes du batch : durée et groupe de jobs Spark par appel (étiquette étape[:sortie])"""
+    sc = spark.sparkContext
+
+    def wrap(name, fn):
+        def stage(*args, **kwargs):
+            label = name
+            if name == 'write_to_hdfs':
+                label += ':' + args[1].rstrip('/').rsplit('/', 1)[-1]
+            elif name in ('write_to_mongodb', 'upsert_to_mongodb'):
+                label += ':' + args[1]
+            sc.setJobGroup(label, label)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings.setdefault(label, []).append(time.perf_counter() - start)
+                sc.setJobGroup(batch.SPARK_JOB_GROUP, 'Velib batch pipeline')
+        return stage
+
+    for name in BATCH_STAGES:
+        if hasattr(batch, name):
+            setattr(batch, name, wrap(name, getattr(batch, name)))
+
+
+def spark_jobs(spark, group):
+    """(jobs, stages) Spark d'un groupe"""
+    tracker = spark.sparkContext.statusTracker()
+    jobs = tracker.getJobIdsForGroup(group)
+    stages = set()
+    for job_id in jobs:
+        info = tracker.getJobInfo(job_id)
+        if info is not None:
+            stages.update(info.stageIds)
+    return len(jobs), len(stages)
+
+
+def bench_batch(n_stations, days, period_s, archive_format='parquet'):
+    """Chaque étape de run_batch_pipeline sur days jours d'historique synthétique"""
+    root = tempfile.mkdtemp(prefix='velib-suite-')
+    # Les exécuteurs importent sinks (MemoryClient) : même PYTHONPATH que le driver
+    os.environ['PYTHONPATH'] = os.pathsep.join(p for p in (BENCHMARKS_DIR, os.environ.get('PYTHONPATH')) if p)
+    from pyspark.sql import SparkSession
+    try:
+        feed = SyntheticFeed(n_stations)
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows, generate_s = timed(write_history, root, feed, days, period_s, archive_format)
+
+        batch = load_script('batch/batch-velib.py', 'batch_under_test')
+        base = 'file://' + root + '/velib/'
+        batch.HDFS_INPUT_PATH = base + 'raw/'
+        batch.HDFS_ARCHIVE_PATH = base + 'archive/'
+        batch.HDFS_SNAPSHOT_PATH = base + 'snapshots/'
+        batch.HDFS_OUTPUT_PATH = base + 'processed/'
+        batch.MongoClient = MemoryClient
+
+        spark = SparkSession.builder.master('local[*]').appName('VelibBatchSuite').getOrCreate()
+        spark.sparkContext.setLogLevel('ERROR')
+        try:
+            timings = {}
+            instrument(batch, spark, timings)
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, duration = timed(batch.run_batch_pipeline, spark)
+            stages = {}
+            for label, d in timings.items():
+                summary = summarize(d, rows)
+                summary['spark_jobs'], summary['spark_stages'] = spark_jobs(spark, label)
+                stages[label] = summary
+
+            detected = dict((r['incidentType'], r['n']) for r in
+                            spark.read.parquet(batch.HDFS_OUTPUT_PATH + 'station_incidents/')
+                            .groupBy('incidentType').sum('incidentCount')
+                            .withColumnRenamed('sum(incidentCount)', 'n').collect())
+            anomalies = spark.read.parquet(batch.HDFS_OUTPUT_PATH + 'anomalies/').count()
+        finally:
+            spark.stop()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    detectors = dict((t, {'injected': n, 'detected': detected.get(t, 0)}) for t, n in feed.injected.items())
+    detectors['STATIC_STATION'] = {'injected': feed.static_stations(), 'detected': anomalies}
+    return {
+        'stations': n_stations,
+        'days': days,
+        'period_s': period_s,
+        'format': archive_format,
+        'rows': rows,
+        'generate_s': generate_s,
+        'duration_s': duration,
+        'stages': stages,
+        'detectors': detectors,
+    }
+
+
+def measures(results):
+    """Mesures comparables d'un fichier de résultats : {(section, stations, étape): durée}"""
+    flat = {}
+    for run in results.get('streaming', []):
+        for stage, summary in run['stages'].items():
+            flat[('streaming', run['stations'], stage)] = summary['mean_s']
+    for run in results.get('batch', []):
+        flat[('batch', run['stations'], 'run_batch_pipeline')] = run['duration_s']
+        for stage, summary in run['stages'].items():
+            flat[('batch', run['stations'], stage)] = summary['total_s']
+    return flat
+
+
+def compare(results, baseline, threshold):
+    """Affiche le rapport courant / référence de chaque mesure ; retourne le nombre de régressions"""
+    current, reference = measures(results), measures(baseline)
+    regressions = 0
+    for key in sorted(set(current) & set(reference)):
+        if not reference[key]:
+            continue
+        ratio = current[key] / reference[key]
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  ⚠️ regression'
+            regressions += 1
+        print('%-9s %6d  %-45s %9.4fs -> %9.4fs  x%.2f%s' % (key + (reference[key], current[key], ratio, flag)),
+              file=sys.stderr)
+    return regressions
+
+
+def sizes(value):
+    return [int(s) for s in value.split(',') if s]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=sizes, default=[500, 1500, 5000])
+    parser.add_argument('--ticks', type=int, default=30)
+    parser.add_argument('--batch-sizes', type=sizes, default=[200, 1000])
+    parser.add_argument('--days', type=float, default=1)
+    parser.add_argument('--period', type=int, default=300)
+    parser.add_argument('--format', choices=('parquet', 'snapshot', 'json'), default='parquet')
+    parser.add_argument('--skip-streaming', action='store_true')
+    parser.add_argument('--skip-batch', action='store_true')
+    parser.add_argument('--output')
+    parser.add_argument('--compare')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = {
+        'created': datetime.datetime.now().isoformat(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'streaming': [] if args.skip_streaming else [bench_streaming(n, args.ticks) for n in args.sizes],
+        'batch': [] if args.skip_batch else [bench_batch(n, args.days, args.period, args.format)
+                                             for n in args.batch_sizes],
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.compare:
+        with open(args.compare) as f:
+            sys.exit(1 if compare(results, json.load(f), args.threshold) else 0)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark de la transformation du payload JCDecaux :
+- legacy  : [transform(r) for r in records if transform(r)] (double appel)
+- per_row : un appel à transform par station
+- columns : transform_batch (colonnes NumPy) seul
+- rows    : transform_batch + columns_to_rows (documents pour les sinks)
+
+Usage : python benchmarks/transform.py [n_stations] [repeat]
+"""
+
+from __future__ import print_function
+import json
+import sys
+
+from common import load_script, sample_records, timed
+
+
+def best_of(repeat, fn, *args):
+    return min(timed(fn, *args)[1] for _ in range(repeat))
+
+
+def run(n_stations=3000, repeat=20):
+    streaming = load_script('streaming/streaming-velib.py')
+    transform = streaming.transform
+    records = sample_records(n_stations)
+    return {
+        'stations': n_stations,
+        'repeat': repeat,
+        'legacy_s': best_of(repeat, lambda rs: [transform(r) for r in rs if transform(r)], records),
+        'per_row_s': best_of(repeat, lambda rs: [transform(r) for r in rs], records),
+        'columns_s': best_of(repeat, streaming.transform_batch, records),
+        'rows_s': best_of(repeat, streaming.transform_all, records),
+    }
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    r = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(json.dumps(run(n, r), indent=2))
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Archivage Parquet des ticks du streaming
+
+Les ticks sont accumulés en mémoire (RecordBatch Arrow construits directement
+à partir des colonnes de transform_batch) puis écrits en un seul fichier
+Parquet compressé quand un seuil de lignes ou d'âge est atteint, ou quand
+l'heure change. Disposition : <base>/date=YYYY-MM-DD/hour=H/part-*.parquet
+SnapshotArchiver applique la même mise en tampon au format binaire compact
+de snapshot.py (part-*.vlb + fichier de dimension quotidien).
+"""
+
+import os
+import time
+import uuid
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from snapshot import DIMENSION_FILE, SNAPSHOT_EXTENSION, StationIndex, encode_snapshot
+
+COUNT_FIELDS = (
+    'capacity',
+    'numBikesAvailable',
+    'numDocksAvailable',
+    'numMechanicalBikes',
+    'numElectricBikes',
+    'numElectricInternalBatteryBikes',
+    'numElectricRemovableBatteryBikes',
+)
+
+# Même forme que les documents produits par transform (timestamp du tick,
+# lastUpdate de la source et prevSeen du filtre de l'archive en ISO, en chaînes)
+ARCHIVE_SCHEMA = pa.schema(
+    [('stationCode', pa.string()), ('name', pa.string())] +
+    [(f, pa.int32()) for f in COUNT_FIELDS] +
+    [('isInstalled', pa.bool_()),
+     ('coordinates', pa.list_(pa.float64())),
+     ('timestamp', pa.string()),
+     ('lastUpdate', pa.string()),
+     ('prevSeen', pa.string())]
+)
+
+
+class LocalWriter(object):
+    """Écrit les fichiers sous un répertoire local (développement, benchmarks)"""
+
+    def __init__(self, root):
+        self.root = root
+        self.bytes_written = 0
+
+    def write(self, path, data):
+        full_path = os.path.join(self.root, path.lstrip('/'))
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = full_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, full_path)
+        self.bytes_written += len(data)
+
+    def read(self, path):
+        """Contenu d'un fichier, ou None s'il n'existe pas"""
+        full_path = os.path.join(self.root, path.lstrip('/'))
+        if not os.path.exists(full_path):
+            return None
+        with open(full_path, 'rb') as f:
+            return f.read()
+
+
+class WebHDFSWriter(object):
+    """Écrit les fichiers dans HDFS via WebHDFS (sans JVM)"""
+
+    def __init__(self, client):
+        self.client = client
+        self.bytes_written = 0
+
+    def write(self, path, data):
+        self.client.write(path, data=data, overwrite=True)
+        self.bytes_written += len(data)
+
+    def read(self, path):
+        if self.client.status(path, strict=False) is None:
+            return None
+        with self.client.read(path) as reader:
+            return reader.read()
+
+
+def columns_to_record_batch(columns):
+    """Convertit les colonnes NumPy de transform_batch en RecordBatch Arrow"""
+    n = len(columns['stationCode'])
+    coordinates = np.column_stack([columns['longitude'], columns['latitude']]).ravel()
+    offsets = np.arange(0, 2 * n + 1, 2, dtype=np.int32)
+    arrays = [
+        pa.array(columns['stationCode'].tolist(), pa.string()),
+        pa.array(columns['name'].tolist(), pa.string()),
+    ]
+    arrays += [pa.array(columns[f], pa.int32()) for f in COUNT_FIELDS]
+    arrays += [
+        pa.array(columns['isInstalled'], pa.bool_()),
+        pa.ListArray.from_arrays(pa.array(offsets), pa.array(coordinates, pa.float64())),
+        pa.array([columns['timestamp']] * n, pa.string()),
+        pa.array(columns['lastUpdate'].tolist(), pa.string()),
+        pa.array(columns['prevSeen'].tolist(), pa.string()) if 'prevSeen' in columns else pa.nulls(n, pa.string()),
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=ARCHIVE_SCHEMA)
+
+
+class BufferedArchiver(object):
+    """Tampon de ticks vidé en un fichier par partition (date, heure), par seuil de taille / d'âge / changement d'heure
+
+    Un tick ajouté est toujours conservé : si l'écriture d'un fichier échoue,
+    l'exception est propagée et la partition correspondante reste dans le
+    tampon jusqu'au prochain flush réussi. Les sous-classes définissent
+    _convert (forme du tick en tampon) et _write (encodage et écriture).
+    """
+
+    extension = None
+
+    def __init__(self, writer, base_dir, flush_rows=200000, flush_seconds=900, clock=time.time):
+        self.writer = writer
+        self.base_dir = base_dir.rstrip('/')
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        # (date, heure) -> ticks en attente ; plusieurs partitions seulement après un échec
+        self.buffers = {}
+        self.rows = 0
+        self.opened_at = None
+
+    def _convert(self, columns):
+        return columns
+
+    def _write(self, path, partition, items):
+        raise NotImplementedError
+
+    def add(self, columns):
+        """Ajoute un tick ; retourne le dernier chemin écrit si le tampon a été vidé, sinon None"""
+        return self.flush_due(self.append(columns))
+
+    def append(self, columns):
+        """Met un tick en tampon, sans écriture ; retourne sa partition"""
+        timestamp = columns['timestamp']
+        partition = (timestamp[:10], int(timestamp[11:13]))
+        item = self._convert(columns)
+        if not self.buffers:
+            self.opened_at = self.clock()
+        self.buffers.setdefault(partition, []).append(item)
+        self.rows += len(columns['stationCode'])
+        return partition
+
+    def flush_due(self, partition):
+        """Vide le tampon si un seuil est atteint (partition : celle du dernier tick ajouté)"""
+        if self.rows >= self.flush_rows or self.clock() - self.opened_at >= self.flush_seconds:
+            return self.flush()
+        if len(self.buffers) > 1:
+            # Changement d'heure : les heures terminées sont écrites, la nouvelle reste en tampon
+            return self.flush(keep=partition)
+        return None
+
+    def flush(self, keep=None):
+        """Écrit toutes les partitions en tampon (sauf keep) ; retourne le dernier chemin écrit"""
+        written = None
+        for partition in sorted(self.buffers):
+            if partition == keep:
+                continue
+            items = self.buffers[partition]
+            date, hour = partition
+            path = '%s/date=%s/hour=%d/part-%s-%s.%s' % (
+                self.base_dir, date, hour, time.strftime('%H%M%S'), uuid.uuid4().hex[:8], self.extension)
+            rows = self._write(path, partition, items)
+            del self.buffers[partition]
+            self.rows -= rows
+            written = path
+        if not self.buffers:
+            self.opened_at = None
+        elif keep is not None and written is not None:
+            self.opened_at = self.clock()
+        return written
+
+
+class ParquetArchiver(BufferedArchiver):
+    """Ticks en RecordBatch Arrow, écrits en un fichier Parquet compressé par partition"""
+
+    extension = 'parquet'
+
+    def __init__(self, writer, base_dir, flush_rows=200000, flush_seconds=900,
+                 compression='zstd', clock=time.time):
+        BufferedArchiver.__init__(self, writer, base_dir, flush_rows, flush_seconds, clock)
+        self.compression = compression
+
+    def _convert(self, columns):
+        return columns_to_record_batch(columns)
+
+    def _write(self, path, partition, items):
+        table = pa.Table.from_batches(items, schema=ARCHIVE_SCHEMA)
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink, compression=self.compression)
+        self.writer.write(path, sink.getvalue().to_pybytes())
+        return table.num_rows
+
+
+class SnapshotArchiver(BufferedArchiver):
+    """Ticks au format snapshot : deltas par station + fichier de dimension quotidien
+
+    L'indice des stations d'une journée est relu depuis le fichier de dimension
+    au premier flush de la journée (redémarrage en cours de journée) ; le
+    fichier est réécrit avant les observations qui utilisent un nouvel indice.
+    """
+
+    extension = SNAPSHOT_EXTENSION
+
+    def __init__(self, writer, base_dir, flush_rows=200000, flush_seconds=900, clock=time.time):
+        BufferedArchiver.__init__(self, writer, base_dir, flush_rows, flush_seconds, clock)
+        self.indexes = {}
+
+    def dimension_path(self, date):
+        return '%s/date=%s/%s' % (self.base_dir, date, DIMENSION_FILE)
+
+    def station_index(self, date):
+        if date not in self.indexes:
+            # Seules les journées encore en tampon gardent leur indice en mémoire
+            for old in [d for d in self.indexes if d < date]:
+                del self.indexes[old]
+            data = self.writer.read(self.dimension_path(date))
+            self.indexes[date] = StationIndex.loads(data) if data else StationIndex()
+        return self.indexes[date]
+
+    def _write(self, path, partition, items):
+        date = partition[0]
+        station_index = self.station_index(date)
+        data = encode_snapshot(items, station_index)
+        if station_index.changed:
+            self.writer.write(self.dimension_path(date), station_index.dumps().encode('utf-8'))
+            station_index.changed = False
+        self.writer.write(path, data)
+        return sum(len(columns['stationCode']) for columns in items)
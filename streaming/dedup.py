@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Déduplication des lectures JCDecaux sur le temps de l'événement (lastUpdate)
+
+L'API renvoie à chaque appel la dernière lecture connue de chaque station,
+datée par lastUpdate : tant que la station n'a pas été rafraîchie, la même
+lecture revient à chaque tick. ReadingFilter garde le dernier lastUpdate vu
+par station et ne laisse passer que les lectures nouvelles ; une station
+sans lastUpdate passe toujours. Les lectures ne sont mémorisées (remember)
+qu'une fois écrites : un tick dont l'écriture échoue est renvoyé en entier.
+
+Avec presence=True (archive), le filtre suit aussi l'heure du tick : le
+batch mesure les durées d'état sur la présence des stations, pas sur
+lastUpdate. Chaque ligne gardée porte prevSeen, le dernier tick où la
+station figurait dans la réponse (la lecture précédente a duré jusque-là),
+et une lecture inchangée est tout de même gardée au premier tick de chaque
+journée (chaque partition date=... se suffit), au retour d'une station
+absente du tick précédent et au premier tick après plus de gap_seconds sans
+tick (le trou reste visible). Le batch traite les lignes répétées d'une même
+lecture comme de simples présences.
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+
+def event_time(value):
+    """lastUpdate de l'API (ISO 8601 avec fuseau) en ISO local à la seconde, même horloge que timestamp"""
+    if not value:
+        return None
+    try:
+        when = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is not None:
+        when = when.astimezone().replace(tzinfo=None)
+    return when.isoformat(timespec='seconds')
+
+
+def select_columns(columns, mask):
+    """Sous-ensemble des stations d'un tick (les valeurs scalaires, comme timestamp, sont gardées)"""
+    return dict((name, values[mask] if isinstance(values, np.ndarray) else values)
+                for name, values in columns.items())
+
+
+class ReadingFilter(object):
+    """Dernier lastUpdate vu par station ; avec presence=True, aussi le dernier tick de présence"""
+
+    def __init__(self, presence=False, gap_seconds=None):
+        self.last_seen = {}
+        self.presence = presence
+        self.gap_seconds = gap_seconds
+        self.last_polled = {}
+        self.last_tick = None
+
+    def fresh(self, columns):
+        """Masque des lectures à écrire pour un tick"""
+        last_seen = self.last_seen
+        codes = columns['stationCode'].tolist()
+        updates = columns['lastUpdate'].tolist()
+        if not self.presence:
+            return np.fromiter((u is None or last_seen.get(c) != u for c, u in zip(codes, updates)),
+                               dtype=bool, count=len(codes))
+        last_polled, last_tick = self.last_polled, self.last_tick
+        if last_tick is not None and self.keyframe(last_tick, columns['timestamp']):
+            return np.ones(len(codes), dtype=bool)
+        return np.fromiter((u is None or last_seen.get(c) != u or last_polled.get(c) != last_tick
+                            for c, u in zip(codes, updates)), dtype=bool, count=len(codes))
+
+    def keyframe(self, last_tick, timestamp):
+        """Tick à écrire en entier : nouvelle journée, ou trou de plus de gap_seconds depuis le tick précédent"""
+        if last_tick[:10] != timestamp[:10]:
+            return True
+        if self.gap_seconds is None:
+            return False
+        elapsed = datetime.fromisoformat(timestamp) - datetime.fromisoformat(last_tick)
+        return elapsed.total_seconds() > self.gap_seconds
+
+    def remember(self, columns):
+        """Mémorise les lectures d'un tick comme vues (après leur écriture)"""
+        self.last_seen.update(zip(columns['stationCode'].tolist(), columns['lastUpdate'].tolist()))
+
+    def record_tick(self, columns):
+        """Mémorise la présence des stations d'un tick complet (après son écriture)"""
+        if self.presence:
+            self.last_polled.update(dict.fromkeys(columns['stationCode'].tolist(), columns['timestamp']))
+            self.last_tick = columns['timestamp']
+
+    def select(self, columns):
+        """Colonnes du tick réduites aux lectures à écrire ; retourne (colonnes, lectures écartées)
+
+        Avec presence=True, les colonnes retournées ont en plus prevSeen (None : inconnu)
+        """
+        mask = self.fresh(columns)
+        selected = columns if mask.all() else select_columns(columns, mask)
+        if self.presence:
+            selected = dict(selected, prevSeen=np.array(
+                [self.last_polled.get(c) for c in selected['stationCode'].tolist()], dtype=object))
+        return selected, int(len(mask) - mask.sum())
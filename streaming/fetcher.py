@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Récupération concurrente des stations JCDecaux pour plusieurs contrats
+
+Tous les contrats d'un tick sont interrogés en parallèle (asyncio + aiohttp)
+sur une session HTTP unique dont les connexions sont réutilisées d'un tick
+à l'autre. Chaque contrat a son propre timeout, ses retries avec backoff
+exponentiel « jittered » et ses validateurs ETag / Last-Modified.
+"""
+
+import asyncio
+import json
+import random
+import time
+
+import aiohttp
+
+JCDECAUX_API_BASE = 'https://api.jcdecaux.com/vls/v3'
+
+
+class RetryableStatus(Exception):
+    """Réponse HTTP transitoire (429, 5xx) qui justifie une nouvelle tentative"""
+
+
+class ContractFetcher(object):
+    """Interroge une liste de contrats JCDecaux en parallèle
+
+    fetch() retourne (records, stats) : la concaténation des stations de tous
+    les contrats, et pour chaque contrat son statut ('ok', 'not_modified',
+    'error'), le nombre de tentatives, la latence et la taille de la réponse.
+    Sur un 304, le dernier payload connu du contrat est réutilisé ; un contrat
+    en erreur (y compris une réponse qui n'est pas du JSON) ne contribue aucune
+    station au tick, sans affecter les autres contrats.
+    """
+
+    def __init__(self, contracts, api_key, base_url=JCDECAUX_API_BASE, timeout=10.0,
+                 retries=3, backoff=0.5, max_connections=None):
+        self.contracts = list(contracts)
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # Par défaut une connexion par contrat : tout le cycle part en une seule vague
+        self.max_connections = max_connections or len(self.contracts)
+        self.validators = {}
+        self.last_payload = {}
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+
+    def _get_session(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    def _headers(self, contract):
+        etag, last_modified = self.validators.get(contract, (None, None))
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    async def _fetch_contract(self, contract):
+        session = self._get_session()
+        params = {'contract': contract, 'apiKey': self.api_key}
+        start = time.perf_counter()
+        attempt = 0
+        size = 0
+        while True:
+            attempt += 1
+            try:
+                timeout = aiohttp.ClientTimeout(total=self.timeout)
+                async with session.get(self.base_url + '/stations', params=params,
+                                       headers=self._headers(contract), timeout=timeout) as resp:
+                    if resp.status == 304:
+                        status = 'not_modified'
+                        break
+                    if resp.status == 429 or resp.status >= 500:
+                        raise RetryableStatus('HTTP %d' % resp.status)
+                    resp.raise_for_status()
+                    body = await resp.read()
+                    size = len(body)
+                    try:
+                        data = json.loads(body)
+                    except ValueError as e:
+                        # Corps illisible (page d'erreur HTML, JSON tronqué) : pas de retry
+                        print('API error (' + contract + '): invalid JSON,', repr(e))
+                        status = 'error'
+                        break
+                    if not isinstance(data, list):
+                        data = []
+                    data = [record for record in data if isinstance(record, dict)]
+                    for record in data:
+                        record.setdefault('contractName', contract)
+                    self.last_payload[contract] = data
+                    self.validators[contract] = (resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+                    status = 'ok'
+                    break
+            except (aiohttp.ClientError, asyncio.TimeoutError, RetryableStatus) as e:
+                client_error = isinstance(e, aiohttp.ClientResponseError) and e.status < 500
+                if client_error or attempt > self.retries:
+                    print('API error (' + contract + '):', repr(e))
+                    status = 'error'
+                    break
+                # Backoff exponentiel avec « full jitter »
+                await asyncio.sleep(random.uniform(0, self.backoff * (2 ** (attempt - 1))))
+        return contract, {
+            'status': status,
+            'attempts': attempt,
+            'latency_s': time.perf_counter() - start,
+            'bytes': size,
+        }
+
+    async def _fetch_all(self):
+        return await asyncio.gather(*[self._fetch_contract(c) for c in self.contracts])
+
+    def fetch(self):
+        results = self.loop.run_until_complete(self._fetch_all())
+        records = []
+        stats = {}
+        for contract, info in results:
+            payload = [] if info['status'] == 'error' else self.last_payload.get(contract, [])
+            info['stations'] = len(payload)
+            stats[contract] = info
+            records.extend(payload)
+        return records, stats
+
+    def close(self):
+        if self.session is not None:
+            self.loop.run_until_complete(self.session.close())
+            self.session = None
+        self.loop.close()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Prévision de disponibilité à court terme (15 / 30 / 60 minutes)
+
+Les modèles sont entraînés par le batch (collection forecast_models, un
+document par station) :
+- profile      : vélos moyens par heure de la semaine (168 valeurs, lundi 0h = 0)
+- phi          : persistance sur une heure de l'écart au profil (corrélation
+                 entre deux heures consécutives, entre 0 et 1)
+- capacity     : capacité de la station, borne des prévisions
+
+prévision(t + h) = profil(t + h) + (vélos(t) - profil(t)) * phi ** (h / 60)
+
+L'écart observé maintenant s'estompe vers le profil saisonnier, d'autant
+plus vite que la station est peu persistante. Le profil est interpolé entre
+les milieux des heures. Toutes les stations sont prévues en un appel
+vectorisé (NumPy) ; une station sans modèle garde sa valeur courante.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+
+FORECAST_HORIZONS = (15, 30, 60)
+HOURS_PER_WEEK = 168
+
+
+class ForecastModel(object):
+    """Paramètres de toutes les stations rangés en tableaux NumPy"""
+
+    def __init__(self, codes, profiles, phi, capacity):
+        self.codes = list(codes)
+        self.index = dict((code, i) for i, code in enumerate(self.codes))
+        self.profiles = np.asarray(profiles, dtype=np.float64).reshape(len(self.codes), HOURS_PER_WEEK)
+        self.phi = np.clip(np.nan_to_num(np.asarray(phi, dtype=np.float64)), 0.0, 1.0)
+        self.capacity = np.asarray(capacity, dtype=np.float64)
+
+    @classmethod
+    def from_documents(cls, documents):
+        documents = [d for d in documents if len(d.get('profile') or []) == HOURS_PER_WEEK]
+        return cls([d['stationCode'] for d in documents],
+                   [d['profile'] for d in documents],
+                   [d.get('phi') or 0.0 for d in documents],
+                   [d.get('capacity') or 0 for d in documents])
+
+    @classmethod
+    def load(cls, collection):
+        """Charge les modèles depuis la collection MongoDB écrite par le batch"""
+        return cls.from_documents(collection.find({}, {'_id': 0, 'stationCode': 1, 'profile': 1,
+                                                       'phi': 1, 'capacity': 1}))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def positions(self, codes):
+        """Indice de chaque station dans les tableaux du modèle (-1 si inconnue)"""
+        return np.fromiter((self.index.get(code, -1) for code in codes), dtype=np.int64, count=len(codes))
+
+    def baseline(self, idx, when):
+        """Profil des stations idx à l'instant when (datetime), interpolé entre les milieux des heures"""
+        position = when.weekday() * 24 + when.hour + when.minute / 60.0 + when.second / 3600.0 - 0.5
+        left = int(np.floor(position))
+        weight = position - left
+        profiles = self.profiles[idx]
+        return (1 - weight) * profiles[:, left % HOURS_PER_WEEK] + weight * profiles[:, (left + 1) % HOURS_PER_WEEK]
+
+    def predict(self, codes, bikes, when, horizons=FORECAST_HORIZONS):
+        """Vélos prévus pour chaque station et chaque horizon (minutes) : tableau [station, horizon]
+
+        codes et bikes sont alignés (par exemple les colonnes stationCode et
+        numBikesAvailable de transform_batch) ; when est l'instant des observations.
+        """
+        bikes = np.asarray(bikes, dtype=np.float64)
+        pos = self.positions(codes)
+        known = pos >= 0
+        idx = pos[known]
+        deviation = bikes[known] - self.baseline(idx, when)
+
+        forecast = np.repeat(bikes[:, None], len(horizons), axis=1)
+        for j, minutes in enumerate(horizons):
+            expected = self.baseline(idx, when + timedelta(minutes=minutes)) + deviation * self.phi[idx] ** (minutes / 60.0)
+            forecast[known, j] = np.clip(expected, 0.0, self.capacity[idx])
+        return forecast
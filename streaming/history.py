@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Historique temps réel des stations dans MongoDB
+
+Chaque tick est inséré en un seul insert_many dans une collection
+time-series (metaField stationCode, granularité minute, TTL) : MongoDB
+regroupe les mesures d'une station dans des buckets compacts. Des agrégats
+5 min / 1 h sont tenus en mémoire (tableaux NumPy indexés par station) et
+insérés dans leurs propres collections time-series à la fermeture de chaque
+fenêtre ; les requêtes d'historique récent n'ont pas à parcourir les mesures
+brutes.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+from pymongo.errors import BulkWriteError, CollectionInvalid
+
+# Champs d'une mesure brute (en plus de stationCode et timestamp)
+HISTORY_FIELDS = (
+    'capacity',
+    'numBikesAvailable',
+    'numDocksAvailable',
+    'numMechanicalBikes',
+    'numElectricBikes',
+    'isInstalled',
+)
+
+# Fenêtres des agrégats : (durée en secondes, suffixe de la collection, granularité time-series)
+ROLLUP_WINDOWS = (
+    (300, '_5m', 'minutes'),
+    (3600, '_1h', 'hours'),
+)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def ensure_timeseries_collection(db, name, granularity, ttl_seconds):
+    """Crée la collection time-series si elle n'existe pas encore et la retourne"""
+    if name not in db.list_collection_names():
+        try:
+            db.create_collection(
+                name,
+                timeseries={'timeField': 'timestamp', 'metaField': 'stationCode', 'granularity': granularity},
+                expireAfterSeconds=int(ttl_seconds),
+            )
+        except CollectionInvalid:
+            # Créée entre-temps par une autre instance
+            pass
+    return db[name]
+
+
+def history_documents(columns, when):
+    """Une mesure par station, construite à partir des colonnes de transform_batch"""
+    codes = columns['stationCode'].tolist()
+    values = [columns[f].tolist() for f in HISTORY_FIELDS]
+    return [dict(zip(HISTORY_FIELDS, v), stationCode=code, timestamp=when)
+            for code, v in zip(codes, zip(*values))]
+
+
+class RollingRollup(object):
+    """Agrégats par station sur des fenêtres fixes de window secondes
+
+    Les stations ont un indice stable dans des tableaux NumPy ; chaque tick
+    met à jour toutes les stations en quelques opérations vectorisées.
+    """
+
+    def __init__(self, window):
+        self.window = int(window)
+        self.index = {}
+        self.codes = []
+        self.bucket = None
+        self._allocate(0)
+
+    def _allocate(self, size):
+        self.samples = np.zeros(size, dtype=np.int64)
+        self.sum_bikes = np.zeros(size, dtype=np.int64)
+        self.min_bikes = np.full(size, np.iinfo(np.int32).max, dtype=np.int64)
+        self.max_bikes = np.full(size, -1, dtype=np.int64)
+        self.sum_docks = np.zeros(size, dtype=np.int64)
+        self.sum_mechanical = np.zeros(size, dtype=np.int64)
+        self.sum_electric = np.zeros(size, dtype=np.int64)
+        self.empty = np.zeros(size, dtype=np.int64)
+        self.full = np.zeros(size, dtype=np.int64)
+        self.capacity = np.zeros(size, dtype=np.int64)
+
+    def _grow(self, size):
+        old = dict((name, getattr(self, name)) for name in (
+            'samples', 'sum_bikes', 'min_bikes', 'max_bikes', 'sum_docks',
+            'sum_mechanical', 'sum_electric', 'empty', 'full', 'capacity'))
+        self._allocate(max(size, 2 * len(old['samples'])))
+        for name, array in old.items():
+            getattr(self, name)[:len(array)] = array
+
+    def positions(self, codes):
+        """Indices des stations dans les tableaux (les nouvelles stations sont ajoutées)"""
+        positions = np.empty(len(codes), dtype=np.int64)
+        for i, code in enumerate(codes):
+            position = self.index.get(code)
+            if position is None:
+                position = self.index[code] = len(self.codes)
+                self.codes.append(code)
+            positions[i] = position
+        if len(self.codes) > len(self.samples):
+            self._grow(len(self.codes))
+        return positions
+
+    def add(self, columns, when):
+        """Ajoute un tick ; retourne les documents de la fenêtre précédente si ce tick l'a close"""
+        seconds = int((when - EPOCH).total_seconds())
+        bucket = seconds - seconds % self.window
+        closed = []
+        if self.bucket is not None and bucket != self.bucket:
+            closed = self.documents()
+            self.reset()
+        self.bucket = bucket
+
+        idx = self.positions(columns['stationCode'].tolist())
+        bikes = columns['numBikesAvailable']
+        docks = columns['numDocksAvailable']
+        self.samples[idx] += 1
+        self.sum_bikes[idx] += bikes
+        self.min_bikes[idx] = np.minimum(self.min_bikes[idx], bikes)
+        self.max_bikes[idx] = np.maximum(self.max_bikes[idx], bikes)
+        self.sum_docks[idx] += docks
+        self.sum_mechanical[idx] += columns['numMechanicalBikes']
+        self.sum_electric[idx] += columns['numElectricBikes']
+        self.empty[idx] += bikes == 0
+        self.full[idx] += docks == 0
+        self.capacity[idx] = columns['capacity']
+        return closed
+
+    def documents(self):
+        """Documents de la fenêtre en cours (une par station observée)"""
+        if self.bucket is None:
+            return []
+        present = np.nonzero(self.samples[:len(self.codes)])[0]
+        samples = self.samples[present]
+        when = EPOCH + timedelta(seconds=self.bucket)
+        fields = {
+            'samples': samples,
+            'avgBikes': self.sum_bikes[present] / samples,
+            'minBikes': self.min_bikes[present],
+            'maxBikes': self.max_bikes[present],
+            'avgDocks': self.sum_docks[present] / samples,
+            'avgMechanicalBikes': self.sum_mechanical[present] / samples,
+            'avgElectricBikes': self.sum_electric[present] / samples,
+            'emptySamples': self.empty[present],
+            'fullSamples': self.full[present],
+            'capacity': self.capacity[present],
+        }
+        names = list(fields)
+        values = [fields[name].tolist() for name in names]
+        return [dict(zip(names, v), stationCode=self.codes[p], timestamp=when, windowSeconds=self.window)
+                for p, v in zip(present.tolist(), zip(*values))]
+
+    def reset(self):
+        size = len(self.samples)
+        self._allocate(size)
+        self.bucket = None
+
+
+class HistoryWriter(object):
+    """Insère chaque tick dans la collection time-series et maintient les agrégats 5 min / 1 h
+
+    Les agrégats d'une fenêtre dont l'insertion échoue (serveur injoignable)
+    sont conservés et renvoyés au tick suivant.
+    """
+
+    def __init__(self, db, collection, ttl_seconds, rollup_ttl_seconds, windows=ROLLUP_WINDOWS):
+        self.collection = ensure_timeseries_collection(db, collection, 'minutes', ttl_seconds)
+        self.rollups = []
+        for window, suffix, granularity in windows:
+            target = ensure_timeseries_collection(db, collection + suffix, granularity, rollup_ttl_seconds)
+            self.rollups.append((RollingRollup(window), target, []))
+
+    def write(self, columns):
+        """Écrit un tick ; retourne (mesures insérées, agrégats insérés)
+
+        Les mesures sont insérées avant la mise à jour des agrégats : si le
+        serveur est injoignable, l'exception est propagée sans rien modifier
+        et le tick peut être réécrit tel quel.
+        """
+        when = datetime.fromisoformat(columns['timestamp'])
+        documents = history_documents(columns, when)
+        if documents:
+            try:
+                self.collection.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                print('❌ MongoDB history error:', len(e.details.get('writeErrors', [])), 'samples rejected')
+
+        for rollup, _, pending in self.rollups:
+            pending.extend(rollup.add(columns, when))
+        return len(documents), self._insert_pending()
+
+    def pending(self):
+        """Nombre d'agrégats en attente d'insertion"""
+        return sum(len(pending) for _, _, pending in self.rollups)
+
+    def _insert_pending(self):
+        inserted = 0
+        for _, target, pending in self.rollups:
+            if not pending:
+                continue
+            try:
+                target.insert_many(pending, ordered=False)
+            except BulkWriteError as e:
+                # Insertion partielle : les documents en erreur ne sont pas renvoyés
+                print('❌ MongoDB history rollup error:', len(e.details.get('writeErrors', [])), 'documents rejected')
+                del pending[:]
+                continue
+            except Exception as e:
+                print('❌ MongoDB history rollup error:', e)
+                continue
+            inserted += len(pending)
+            del pending[:]
+        return inserted
+
+    def flush(self):
+        """Insère les fenêtres en cours (arrêt du pipeline)"""
+        for rollup, _, pending in self.rollups:
+            pending.extend(rollup.documents())
+            rollup.reset()
+        return self._insert_pending()
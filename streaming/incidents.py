@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Détection des incidents en station au fil des ticks
+
+Mêmes règles et même vocabulaire (incidentType) que detect_station_incidents
+dans le batch : OFFLINE (station non installée), CAPACITY_ANOMALY (capacité
+nulle ou > 100) et BRUTAL_CHANGE (plus de 20 vélos d'écart avec l'observation
+précédente), comptés par observation. S'y ajoutent FREQUENTLY_EMPTY /
+FREQUENTLY_FULL (vocabulaire de track_empty_full_stations) quand une station
+reste vide ou pleine pendant un nombre de ticks consécutifs donné.
+
+L'état par station (vélos précédents, moyenne et variance de Welford,
+compteurs de ticks vides/pleins consécutifs) est rangé dans des tableaux
+NumPy indexés par station : la mémoire ne dépend que du nombre de stations.
+Le détecteur compte aussi les incidents du jour par (station, type) : les
+documents reçoivent ce compte par $max, une mise à jour rejouée (spool,
+retry) ne compte donc pas deux fois.
+"""
+
+import numpy as np
+from pymongo import UpdateOne
+
+OFFLINE = 'OFFLINE'
+CAPACITY_ANOMALY = 'CAPACITY_ANOMALY'
+BRUTAL_CHANGE = 'BRUTAL_CHANGE'
+FREQUENTLY_EMPTY = 'FREQUENTLY_EMPTY'
+FREQUENTLY_FULL = 'FREQUENTLY_FULL'
+
+BRUTAL_CHANGE_THRESHOLD = 20
+MAX_CAPACITY = 100
+
+
+class IncidentDetector(object):
+    """Détecteur incrémental : detect(columns) retourne les incidents du tick"""
+
+    def __init__(self, empty_full_ticks=120, brutal_change=BRUTAL_CHANGE_THRESHOLD):
+        self.empty_full_ticks = int(empty_full_ticks)
+        self.brutal_change = brutal_change
+        self.index = {}
+        self.codes = []
+        self.day = None
+        self.counts = {}
+        self._allocate(0)
+
+    def _allocate(self, size):
+        self.prev_bikes = np.full(size, -1, dtype=np.int64)
+        self.samples = np.zeros(size, dtype=np.int64)
+        self.mean = np.zeros(size, dtype=np.float64)
+        self.m2 = np.zeros(size, dtype=np.float64)
+        self.empty_run = np.zeros(size, dtype=np.int32)
+        self.full_run = np.zeros(size, dtype=np.int32)
+
+    def _grow(self, size):
+        old = dict((name, getattr(self, name)) for name in (
+            'prev_bikes', 'samples', 'mean', 'm2', 'empty_run', 'full_run'))
+        self._allocate(max(size, 2 * len(old['samples'])))
+        for name, array in old.items():
+            getattr(self, name)[:len(array)] = array
+
+    def positions(self, codes):
+        """Indices des stations dans les tableaux (les nouvelles stations sont ajoutées)"""
+        positions = np.empty(len(codes), dtype=np.int64)
+        for i, code in enumerate(codes):
+            position = self.index.get(code)
+            if position is None:
+                position = self.index[code] = len(self.codes)
+                self.codes.append(code)
+            positions[i] = position
+        if len(self.codes) > len(self.samples):
+            self._grow(len(self.codes))
+        return positions
+
+    def std_dev(self, idx):
+        """Écart-type (échantillon) des vélos disponibles, NaN avant deux observations"""
+        samples = self.samples[idx]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(samples > 1, np.sqrt(self.m2[idx] / (samples - 1)), np.nan)
+
+    def detect(self, columns):
+        """Met à jour l'état avec un tick ; retourne la liste des incidents détectés"""
+        day = columns['timestamp'][:10]
+        if day != self.day:
+            self.day, self.counts = day, {}
+        idx = self.positions(columns['stationCode'].tolist())
+        bikes = columns['numBikesAvailable'].astype(np.int64)
+        docks = columns['numDocksAvailable']
+        capacity = columns['capacity']
+
+        prev = self.prev_bikes[idx]
+        brutal = (prev >= 0) & (np.abs(bikes - prev) > self.brutal_change)
+        self.prev_bikes[idx] = bikes
+
+        # Welford : moyenne et somme des carrés des écarts, mises à jour en place
+        samples = self.samples[idx] + 1
+        delta = bikes - self.mean[idx]
+        mean = self.mean[idx] + delta / samples
+        self.m2[idx] += delta * (bikes - mean)
+        self.mean[idx] = mean
+        self.samples[idx] = samples
+
+        # Un incident vide/plein est émis une fois, quand la série atteint le seuil
+        empty_run = np.where(bikes == 0, self.empty_run[idx] + 1, 0)
+        full_run = np.where(docks == 0, self.full_run[idx] + 1, 0)
+        self.empty_run[idx] = empty_run
+        self.full_run[idx] = full_run
+
+        masks = (
+            (OFFLINE, ~columns['isInstalled']),
+            (CAPACITY_ANOMALY, (capacity == 0) | (capacity > MAX_CAPACITY)),
+            (BRUTAL_CHANGE, brutal),
+            (FREQUENTLY_EMPTY, empty_run == self.empty_full_ticks),
+            (FREQUENTLY_FULL, full_run == self.empty_full_ticks),
+        )
+        std_dev = self.std_dev(idx)
+        incidents = []
+        for incident_type, mask in masks:
+            for i in np.nonzero(mask)[0].tolist():
+                key = (columns['stationCode'][i], incident_type)
+                self.counts[key] = self.counts.get(key, 0) + 1
+                incidents.append({
+                    'stationCode': columns['stationCode'][i],
+                    'name': columns['name'][i],
+                    'incidentType': incident_type,
+                    'numBikesAvailable': int(bikes[i]),
+                    'previousBikes': int(prev[i]) if prev[i] >= 0 else None,
+                    'meanBikes': float(mean[i]),
+                    'stdDevBikes': None if np.isnan(std_dev[i]) else float(std_dev[i]),
+                    'incidentCount': self.counts[key],
+                })
+        return incidents
+
+
+def incident_updates(incidents, timestamp):
+    """Opérations bulk_write pour station_incidents
+
+    Même clé que le batch (stationCode, date, incidentType) : incidentCount
+    prend le compte du jour tenu par le détecteur ($max, rejouable sans
+    double compte ; après un redémarrage, le compte ne baisse pas et ne
+    reprend qu'une fois dépassé). Le batch réécrit ensuite ces documents avec
+    les comptes calculés sur l'historique complet.
+    """
+    date = timestamp[:10]
+    ops = []
+    for incident in incidents:
+        key = {'stationCode': incident['stationCode'], 'date': date, 'incidentType': incident['incidentType']}
+        details = dict((k, v) for k, v in incident.items() if k not in key and k != 'incidentCount')
+        details.update(lastDetectedAt=timestamp, source='streaming')
+        ops.append(UpdateOne(key, {'$max': {'incidentCount': incident['incidentCount']}, '$set': details},
+                             upsert=True))
+    return ops
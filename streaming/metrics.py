@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Métriques par étape des pipelines streaming et batch
+
+Chaque étape est mesurée par un bloc with metrics.stage('nom') as stage, où
+l'appelant renseigne rows_in / rows_out / bytes / spark_jobs. Les mesures
+alimentent :
+- un endpoint HTTP au format texte Prometheus (/metrics), optionnel ;
+- des lignes de log JSON (une par tick, ou une par étape pour le batch).
+
+Désactivé, stage() retourne un objet inerte partagé : le coût se limite à un
+appel de fonction par étape. Bibliothèque standard uniquement.
+"""
+
+import collections
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# Bornes (secondes) de l'histogramme des durées d'étape
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# Mesures conservées pour les lignes de log (drain), au-delà les plus anciennes sont perdues
+RECENT_LIMIT = 1000
+
+STAGE_FIELDS = ('rows_in', 'rows_out', 'bytes', 'spark_jobs')
+
+
+class Stage(object):
+    """Mesure d'une étape (context manager) ; les champs non renseignés restent à None"""
+
+    __slots__ = ('metrics', 'name', 'start') + STAGE_FIELDS
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.rows_in = self.rows_out = self.bytes = self.spark_jobs = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, error=exc_type is not None,
+                             **dict((f, getattr(self, f)) for f in STAGE_FIELDS))
+        return False
+
+
+class NullStage(object):
+    """Étape inerte des métriques désactivées (les attributs affectés sont ignorés)"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class Metrics(object):
+    """Registre thread-safe des mesures par étape, préfixées par namespace"""
+
+    def __init__(self, namespace, enabled=True):
+        self.namespace = namespace
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.stages = collections.OrderedDict()
+        self.recent = collections.deque(maxlen=RECENT_LIMIT)
+        self.collectors = []
+        self.server = None
+
+    def stage(self, name):
+        return Stage(self, name) if self.enabled else NULL_STAGE
+
+    def observe(self, name, duration, error=False, **fields):
+        """Enregistre une exécution d'étape (durée en secondes, champs de STAGE_FIELDS)"""
+        if not self.enabled:
+            return
+        with self.lock:
+            totals = self.stages.get(name)
+            if totals is None:
+                totals = self.stages[name] = {
+                    'count': 0, 'errors': 0, 'sum': 0.0, 'last': 0.0,
+                    'buckets': [0] * len(DURATION_BUCKETS),
+                    'rows_in': 0, 'rows_out': 0, 'bytes': 0, 'spark_jobs': 0,
+                }
+            totals['count'] += 1
+            totals['errors'] += bool(error)
+            totals['sum'] += duration
+            totals['last'] = duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    totals['buckets'][i] += 1
+            record = {'stage': name, 'duration_s': round(duration, 6)}
+            for field in STAGE_FIELDS:
+                if fields.get(field) is not None:
+                    totals[field] += fields[field]
+                    record[field] = fields[field]
+            if error:
+                record['error'] = True
+            self.recent.append(record)
+
+    def drain(self):
+        """Mesures enregistrées depuis le dernier appel (pour une ligne de log)"""
+        with self.lock:
+            records = list(self.recent)
+            self.recent.clear()
+        return records
+
+    def add_collector(self, collect):
+        """collect() retourne {nom: valeur} ; exporté en gauges à chaque lecture de /metrics"""
+        self.collectors.append(collect)
+
+    def render(self):
+        """Toutes les mesures au format texte Prometheus"""
+        ns = self.namespace
+        lines = [
+            '# HELP %s_stage_duration_seconds Duration of pipeline stages' % ns,
+            '# TYPE %s_stage_duration_seconds histogram' % ns,
+        ]
+        with self.lock:
+            stages = [(name, dict(totals, buckets=list(totals['buckets']))) for name, totals in self.stages.items()]
+        for name, totals in stages:
+            for bound, n in zip(DURATION_BUCKETS, totals['buckets']):
+                lines.append('%s_stage_duration_seconds_bucket{stage="%s",le="%s"} %d' % (ns, name, bound, n))
+            lines.append('%s_stage_duration_seconds_bucket{stage="%s",le="+Inf"} %d' % (ns, name, totals['count']))
+            lines.append('%s_stage_duration_seconds_sum{stage="%s"} %f' % (ns, name, totals['sum']))
+            lines.append('%s_stage_duration_seconds_count{stage="%s"} %d' % (ns, name, totals['count']))
+        for metric, key, kind in (
+                ('stage_last_duration_seconds', 'last', 'gauge'),
+                ('stage_errors_total', 'errors', 'counter'),
+                ('stage_rows_in_total', 'rows_in', 'counter'),
+                ('stage_rows_out_total', 'rows_out', 'counter'),
+                ('stage_bytes_total', 'bytes', 'counter'),
+                ('stage_spark_jobs_total', 'spark_jobs', 'counter')):
+            lines.append('# TYPE %s_%s %s' % (ns, metric, kind))
+            for name, totals in stages:
+                lines.append('%s_%s{stage="%s"} %s' % (ns, metric, name, totals[key]))
+        for collect in self.collectors:
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append('# TYPE %s_%s gauge' % (ns, key))
+                    lines.append('%s_%s %s' % (ns, key, value))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host=''):
+        """Démarre l'endpoint /metrics dans un thread (port 0 : désactivé)"""
+        if not port:
+            return None
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.server = Server((host, int(port)), Handler)
+        thread = threading.Thread(target=self.server.serve_forever, name='velib-metrics', daemon=True)
+        thread.start()
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def json_line(event, **fields):
+    """Ligne de log JSON d'un événement (tick du streaming, étape du batch)"""
+    record = {'event': event, 'time': datetime.now().isoformat()}
+    record.update(fields)
+    return json.dumps(record, ensure_ascii=False, default=str, sort_keys=True)
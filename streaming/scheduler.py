@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Ordonnanceur du pipeline streaming
+
+Les ticks sont calés sur l'horloge murale (multiples de la période), et non
+sur « fin du traitement + sleep » : la période réelle ne dérive pas avec la
+durée du fetch ou des écritures. Le fetch du tick N+1 se fait pendant que
+le thread des sinks traite le tick N ; si les sinks prennent du retard, le
+tick en attente est remplacé par le plus récent ('coalesce') ou le nouveau
+tick est abandonné ('drop').
+"""
+
+import threading
+import time
+import traceback
+
+OVERFLOW_POLICIES = ('coalesce', 'drop')
+
+
+class TickScheduler(object):
+    """Exécute fetch(tick) à chaque tick puis sink(tick, data) dans un thread dédié
+
+    stats contient les compteurs (ticks, skipped, dropped, coalesced, sink_errors)
+    et les dernières latences par étape : lag (retard du déclenchement sur
+    l'heure prévue), fetch, queue (attente avant les sinks), sink et
+    end_to_end (heure prévue -> fin des sinks), en secondes.
+    """
+
+    def __init__(self, period, fetch, sink, overflow='coalesce', clock=time.time, sleep=time.sleep):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('overflow must be one of ' + ', '.join(OVERFLOW_POLICIES))
+        self.period = float(period)
+        self.fetch = fetch
+        self.sink = sink
+        self.overflow = overflow
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = {
+            'ticks': 0, 'skipped': 0, 'dropped': 0, 'coalesced': 0, 'sink_errors': 0,
+            'lag_s': 0.0, 'fetch_s': 0.0, 'queue_s': 0.0, 'sink_s': 0.0, 'end_to_end_s': 0.0,
+        }
+        self._pending = None
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._sink_loop, name='velib-sinks', daemon=True)
+
+    def next_boundary(self, now):
+        """Premier multiple de la période strictement postérieur à now"""
+        return (int(now // self.period) + 1) * self.period
+
+    def _submit(self, item):
+        with self._cond:
+            if self._pending is not None:
+                if self.overflow == 'drop':
+                    self.stats['dropped'] += 1
+                    print('⚠️ Sinks behind, dropping tick ' + str(item[0]))
+                    return
+                self.stats['coalesced'] += 1
+                print('⚠️ Sinks behind, tick ' + str(self._pending[0]) + ' replaced by tick ' + str(item[0]))
+            self._pending = item
+            self._cond.notify()
+
+    def _sink_loop(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopping:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                tick, scheduled, queued_at, lag, fetch_s, data = self._pending
+                self._pending = None
+
+            start = self.clock()
+            try:
+                self.sink(tick, data)
+            except Exception:
+                self.stats['sink_errors'] += 1
+                traceback.print_exc()
+            end = self.clock()
+            self.stats['queue_s'] = start - queued_at
+            self.stats['sink_s'] = end - start
+            self.stats['end_to_end_s'] = end - scheduled
+            print('⏱️ Tick %d: lag %.2fs, fetch %.2fs, queue %.2fs, sinks %.2fs, total %.2fs' % (
+                tick, lag, fetch_s, start - queued_at, end - start, end - scheduled))
+
+    def run(self, max_ticks=None):
+        """Boucle principale (bloquante) ; max_ticks limite le nombre de ticks déclenchés"""
+        self._worker.start()
+        tick = 0
+        scheduled = self.next_boundary(self.clock())
+        try:
+            while max_ticks is None or tick < max_ticks:
+                now = self.clock()
+                if now < scheduled:
+                    self.sleep(scheduled - now)
+                start = self.clock()
+                lag = self.stats['lag_s'] = start - scheduled
+
+                data = self.fetch(tick)
+                fetched_at = self.clock()
+                fetch_s = self.stats['fetch_s'] = fetched_at - start
+                self.stats['ticks'] += 1
+                if data:
+                    self._submit((tick, scheduled, fetched_at, lag, fetch_s, data))
+
+                tick += 1
+                scheduled += self.period
+                # Fetch plus long qu'une période : on se recale sur la dernière échéance passée
+                while scheduled + self.period <= self.clock():
+                    scheduled += self.period
+                    self.stats['skipped'] += 1
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Termine le tick en cours côté sinks puis arrête le thread"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._worker.is_alive():
+            self._worker.join()
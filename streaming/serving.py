@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Documents de service précalculés pour l'API (collection serving)
+
+À chaque tick, le pipeline a déjà toutes les stations en mémoire : il en
+tire quelques documents compacts, remplacés à chaque tick, que l'API lit
+par _id au lieu d'agréger ou de trier la collection stations :
+- live:stats     : totaux et moyennes des stations installées (GET /api/stats)
+- live:top       : les top_n stations installées les plus fournies en vélos
+- live:critical  : stations installées avec au plus threshold vélos ou places
+- live:cells     : agrégats par cellule d'une grille d'environ cell_m mètres
+
+Le batch écrit de la même façon les documents batch:* (voir batch-velib.py).
+Le coût de lecture ne dépend plus du nombre de stations.
+"""
+
+import numpy as np
+from pymongo import ReplaceOne
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE = np.pi * EARTH_RADIUS_M / 180
+
+
+def _round1(value):
+    return round(float(value) * 10) / 10
+
+
+def station_documents(columns, idx):
+    """Documents station (même forme que la collection stations) des indices idx"""
+    documents = []
+    for i in idx.tolist():
+        document = {'stationCode': columns['stationCode'][i], 'name': columns['name'][i]}
+        for field in ('capacity', 'numBikesAvailable', 'numDocksAvailable', 'numMechanicalBikes',
+                      'numElectricBikes', 'numElectricInternalBatteryBikes', 'numElectricRemovableBatteryBikes'):
+            document[field] = int(columns[field][i])
+        document['isInstalled'] = bool(columns['isInstalled'][i])
+        if 'lastUpdate' in columns:
+            document['lastUpdate'] = columns['lastUpdate'][i]
+        document['coordinates'] = [float(columns['longitude'][i]), float(columns['latitude'][i])]
+        document['timestamp'] = columns['timestamp']
+        documents.append(document)
+    return documents
+
+
+def global_stats(columns, installed):
+    """Mêmes champs que l'agrégation de GET /api/stats"""
+    bikes = columns['numBikesAvailable'][installed]
+    docks = columns['numDocksAvailable'][installed]
+    capacity = int(columns['capacity'][installed].sum())
+    stations = int(installed.sum())
+    return {
+        'totalStations': stations,
+        'totalBikes': int(bikes.sum()),
+        'totalDocks': int(docks.sum()),
+        'totalCapacity': capacity,
+        'avgOccupancy': _round1(bikes.sum() * 100.0 / capacity) if capacity else 0,
+        'avgBikesPerStation': _round1(bikes.mean()) if stations else 0,
+        'avgDocksPerStation': _round1(docks.mean()) if stations else 0,
+    }
+
+
+def cell_aggregates(columns, installed, cell_m):
+    """Agrégats par cellule de grille (cellules d'au moins cell_m mètres, comme batch/spatial.py)"""
+    longitudes = columns['longitude'][installed]
+    latitudes = columns['latitude'][installed]
+    if not len(latitudes):
+        return []
+    cell_lat = cell_m / METERS_PER_DEGREE
+    cell_lon = cell_m / (METERS_PER_DEGREE * max(np.cos(np.radians(np.abs(latitudes).max())), 1e-6))
+    cx = np.floor(longitudes / cell_lon).astype(np.int64)
+    cy = np.floor(latitudes / cell_lat).astype(np.int64)
+    cells, inverse = np.unique(np.stack([cx, cy], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    def per_cell(values):
+        return np.bincount(inverse, weights=values, minlength=len(cells))
+
+    bikes = columns['numBikesAvailable'][installed]
+    docks = columns['numDocksAvailable'][installed]
+    stations = per_cell(np.ones(len(inverse)))
+    sums = [per_cell(v) for v in (bikes, docks, columns['capacity'][installed], bikes == 0, docks == 0,
+                                  longitudes, latitudes)]
+    aggregates = []
+    for j, (x, y) in enumerate(cells.tolist()):
+        total_bikes, total_docks, capacity, empty, full, lon, lat = (s[j] for s in sums)
+        aggregates.append({
+            'cell': '%d:%d' % (x, y),
+            'coordinates': [float(lon / stations[j]), float(lat / stations[j])],
+            'stations': int(stations[j]),
+            'totalBikes': int(total_bikes),
+            'totalDocks': int(total_docks),
+            'totalCapacity': int(capacity),
+            'avgOccupancy': _round1(total_bikes * 100.0 / capacity) if capacity else 0,
+            'emptyStations': int(empty),
+            'fullStations': int(full),
+        })
+    return aggregates
+
+
+def summarize_tick(columns, top_n=50, threshold=3, cell_m=1000.0):
+    """Documents live:* d'un tick (colonnes de transform_batch), indexés par _id"""
+    installed = np.asarray(columns['isInstalled'], dtype=bool)
+    bikes = columns['numBikesAvailable']
+    docks = columns['numDocksAvailable']
+    timestamp = columns['timestamp']
+    candidates = np.nonzero(installed)[0]
+
+    # Tri stable : à égalité, l'ordre du tick (comme l'ordre naturel de MongoDB)
+    top = candidates[np.argsort(-bikes[candidates], kind='stable')[:top_n]]
+    critical = candidates[(bikes[candidates] <= threshold) | (docks[candidates] <= threshold)]
+    critical = critical[np.argsort(bikes[critical], kind='stable')]
+
+    return [
+        {'_id': 'live:stats', 'timestamp': timestamp, 'data': global_stats(columns, installed)},
+        {'_id': 'live:top', 'timestamp': timestamp, 'limit': top_n, 'data': station_documents(columns, top)},
+        {'_id': 'live:critical', 'timestamp': timestamp, 'threshold': threshold,
+         'data': station_documents(columns, critical)},
+        {'_id': 'live:cells', 'timestamp': timestamp, 'cellM': cell_m,
+         'data': cell_aggregates(columns, installed, cell_m)},
+    ]
+
+
+class ServingWriter(object):
+    """Remplace les documents de service d'un tick en un seul bulk_write"""
+
+    def __init__(self, collection, top_n=50, threshold=3, cell_m=1000.0):
+        self.collection = collection
+        self.top_n = top_n
+        self.threshold = threshold
+        self.cell_m = cell_m
+
+    def write(self, columns):
+        """Met à jour les documents live:* ; retourne le nombre de documents écrits"""
+        documents = summarize_tick(columns, self.top_n, self.threshold, self.cell_m)
+        self.collection.bulk_write([ReplaceOne({'_id': d['_id']}, d, upsert=True) for d in documents],
+                                   ordered=False)
+        return len(documents)
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Format binaire compact des ticks archivés (ARCHIVE_FORMAT=snapshot)
+
+Seuls les compteurs de disponibilité changent d'un tick à l'autre : les
+métadonnées des stations (code, nom, coordonnées) sont écrites une fois par
+jour dans un fichier de dimension, <base>/date=YYYY-MM-DD/stations.json, qui
+attribue à chaque station un indice dense. Les observations d'une heure sont
+écrites dans <base>/date=YYYY-MM-DD/hour=H/part-*.vlb :
+
+    en-tête   magic 'VLBS', version, nombre de ticks, nombre de stations, nombre de champs
+    ticks     timestamp ISO de chaque tick (TIMESTAMP_BYTES octets, complétés par des zéros)
+    corps     zlib( présence uint8 [tick, station]
+                    + deltas int16 [champ, tick, station] )
+
+Chaque champ est une matrice d'entiers de largeur fixe (tick x indice de
+station) encodée en différences entre ticks consécutifs (une station absente
+d'un tick garde sa valeur précédente) : les deltas sont presque tous nuls et
+se compressent très bien. Ce module ne dépend que de NumPy ; il est aussi
+utilisé par les exécuteurs Spark du batch pour relire les fichiers.
+
+lastUpdate (temps de l'événement) et prevSeen (tick précédent où la station
+était présente, archive dédoublonnée) sont stockés comme des âges en secondes
+avant le tick, bornés à LAST_UPDATE_UNKNOWN (au-delà d'environ 9 h : inconnu) ;
+les fichiers écrits avant ces champs (moins de champs dans l'en-tête) sont
+relus avec des valeurs à None.
+"""
+
+import json
+import re
+import struct
+import zlib
+
+import numpy as np
+
+SNAPSHOT_MAGIC = b'VLBS'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<4sHIIH')
+TIMESTAMP_BYTES = 32
+SNAPSHOT_EXTENSION = 'vlb'
+DIMENSION_FILE = 'stations.json'
+
+# Champs par tick (même ordre que les documents de transform) ; isInstalled est stocké en 0/1
+SNAPSHOT_FIELDS = (
+    'capacity',
+    'numBikesAvailable',
+    'numDocksAvailable',
+    'numMechanicalBikes',
+    'numElectricBikes',
+    'numElectricInternalBatteryBikes',
+    'numElectricRemovableBatteryBikes',
+    'isInstalled',
+    'lastUpdateAge',
+    'prevSeenAge',
+)
+
+# Compteurs (ordre de RAW_SCHEMA), suivis de isInstalled et des âges
+COUNT_FIELDS = SNAPSHOT_FIELDS[:SNAPSHOT_FIELDS.index('isInstalled')]
+
+# Champs stockés en âge avant le tick : champ du fichier -> colonne de transform_batch
+AGE_FIELDS = (('lastUpdateAge', 'lastUpdate'), ('prevSeenAge', 'prevSeen'))
+
+# Âge maximal stockable (int16) : au-delà, ou sans valeur, l'heure est inconnue
+LAST_UPDATE_UNKNOWN = 32767
+
+DATE_PATTERN = re.compile(r'date=(\d{4}-\d{2}-\d{2})')
+
+
+def snapshot_date(path):
+    """Date de la partition date=YYYY-MM-DD contenue dans un chemin"""
+    match = DATE_PATTERN.search(path)
+    return match.group(1) if match else None
+
+
+class StationIndex(object):
+    """Indice dense des stations d'une journée et leurs métadonnées (fichier de dimension)"""
+
+    def __init__(self, stations=None):
+        # [stationCode, name, longitude, latitude] dans l'ordre des indices
+        self.stations = [list(s) for s in stations or []]
+        self.index = dict((s[0], i) for i, s in enumerate(self.stations))
+        self.changed = False
+
+    @classmethod
+    def loads(cls, data):
+        return cls(json.loads(data)['stations'])
+
+    def dumps(self):
+        return json.dumps({'version': SNAPSHOT_VERSION, 'stations': self.stations}, ensure_ascii=False)
+
+    def __len__(self):
+        return len(self.stations)
+
+    def update(self, columns):
+        """Indices des stations d'un tick ; les nouvelles stations et les métadonnées modifiées sont enregistrées"""
+        names = columns['name'].tolist()
+        longitudes = columns['longitude'].tolist()
+        latitudes = columns['latitude'].tolist()
+        positions = np.empty(len(names), dtype=np.int64)
+        for i, code in enumerate(columns['stationCode'].tolist()):
+            entry = [code, names[i], longitudes[i], latitudes[i]]
+            position = self.index.get(code)
+            if position is None:
+                position = self.index[code] = len(self.stations)
+                self.stations.append(entry)
+                self.changed = True
+            elif self.stations[position] != entry:
+                self.stations[position] = entry
+                self.changed = True
+            positions[i] = position
+        return positions
+
+
+def time_ages(columns, field='lastUpdate'):
+    """Âge (secondes) d'une heure de chaque station d'un tick : timestamp du tick - field"""
+    n = len(columns['stationCode'])
+    updates = columns.get(field)
+    if updates is None:
+        return np.full(n, LAST_UPDATE_UNKNOWN, dtype=np.int32)
+    known = np.array([u is not None for u in updates.tolist()], dtype=bool)
+    ages = np.full(n, LAST_UPDATE_UNKNOWN, dtype=np.int64)
+    if known.any():
+        tick = np.datetime64(columns['timestamp'][:19], 's')
+        ages[known] = (tick - updates[known].astype('datetime64[s]')).astype(np.int64)
+    return np.clip(ages, 0, LAST_UPDATE_UNKNOWN).astype(np.int32)
+
+
+def age_strings(timestamp, ages):
+    """Inverse de time_ages : heures ISO à la seconde, None si inconnues"""
+    tick = np.datetime64(timestamp[:19], 's')
+    updates = np.datetime_as_string(tick - ages.astype('timedelta64[s]'), unit='s').astype(object)
+    updates[ages >= LAST_UPDATE_UNKNOWN] = None
+    return updates
+
+
+def encode_snapshot(ticks, station_index):
+    """Encode une liste de ticks (colonnes de transform_batch) ; retourne les octets du fichier"""
+    positions = [station_index.update(columns) for columns in ticks]
+    n_ticks, n_stations = len(ticks), len(station_index)
+    present = np.zeros((n_ticks, n_stations), dtype=bool)
+    values = np.zeros((len(SNAPSHOT_FIELDS), n_ticks, n_stations), dtype=np.int16)
+    ages = dict(AGE_FIELDS)
+    for t, (columns, idx) in enumerate(zip(ticks, positions)):
+        present[t, idx] = True
+        if t:
+            # Station absente : valeur du tick précédent, pour un delta nul
+            values[:, t] = values[:, t - 1]
+        for f, field in enumerate(SNAPSHOT_FIELDS):
+            values[f, t, idx] = time_ages(columns, ages[field]) if field in ages else columns[field]
+    deltas = np.diff(values, axis=1, prepend=np.zeros((len(SNAPSHOT_FIELDS), 1, n_stations), dtype=np.int16))
+
+    timestamps = b''.join(t['timestamp'].encode('ascii')[:TIMESTAMP_BYTES].ljust(TIMESTAMP_BYTES, b'\0')
+                          for t in ticks)
+    body = zlib.compress(present.astype(np.uint8).tobytes() + deltas.astype('<i2').tobytes(), 6)
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, n_ticks, n_stations, len(SNAPSHOT_FIELDS))
+    return header + timestamps + body
+
+
+def decode_snapshot(data):
+    """Décode un fichier ; retourne (timestamps, présence [tick, station], {champ: matrice int32 [tick, station]})"""
+    magic, version, n_ticks, n_stations, n_fields = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError('not a snapshot file (version %d)' % SNAPSHOT_VERSION)
+    offset = SNAPSHOT_HEADER.size
+    timestamps = [data[offset + i * TIMESTAMP_BYTES:offset + (i + 1) * TIMESTAMP_BYTES].rstrip(b'\0').decode('ascii')
+                  for i in range(n_ticks)]
+    body = zlib.decompress(data[offset + n_ticks * TIMESTAMP_BYTES:])
+    cells = n_ticks * n_stations
+    present = np.frombuffer(body, dtype=np.uint8, count=cells).reshape(n_ticks, n_stations).astype(bool)
+    deltas = np.frombuffer(body, dtype='<i2', offset=cells).reshape(n_fields, n_ticks, n_stations)
+    values = np.cumsum(deltas, axis=1, dtype=np.int32)
+    return timestamps, present, dict(zip(SNAPSHOT_FIELDS[:n_fields], values))
+
+
+def snapshot_columns(data, station_index):
+    """Ticks d'un fichier sous forme de colonnes NumPy (même forme que transform_batch)"""
+    timestamps, present, values = decode_snapshot(data)
+    stations = station_index.stations
+    codes = np.array([s[0] for s in stations], dtype=object)
+    names = np.array([s[1] for s in stations], dtype=object)
+    longitudes = np.array([s[2] for s in stations], dtype=np.float64)
+    latitudes = np.array([s[3] for s in stations], dtype=np.float64)
+    n_stations = present.shape[1]
+    for t, timestamp in enumerate(timestamps):
+        idx = np.nonzero(present[t])[0]
+        columns = {
+            'stationCode': codes[:n_stations][idx],
+            'name': names[:n_stations][idx],
+            'longitude': longitudes[:n_stations][idx],
+            'latitude': latitudes[:n_stations][idx],
+            'timestamp': timestamp,
+        }
+        for field in COUNT_FIELDS + ('isInstalled',):
+            columns[field] = values[field][t, idx]
+        columns['isInstalled'] = columns['isInstalled'].astype(bool)
+        for field, name in AGE_FIELDS:
+            if field in values:
+                columns[name] = age_strings(timestamp, values[field][t, idx])
+            else:
+                columns[name] = np.full(len(idx), None, dtype=object)
+        yield columns
+
+
+def snapshot_rows(data, station_index):
+    """Lignes d'un fichier dans l'ordre de RAW_SCHEMA (lecture par Spark)"""
+    for columns in snapshot_columns(data, station_index):
+        coordinates = zip(columns['longitude'].tolist(), columns['latitude'].tolist())
+        counts = [columns[f].tolist() for f in COUNT_FIELDS]
+        for code, name, installed, coords, values, last_update, prev_seen in zip(
+                columns['stationCode'].tolist(), columns['name'].tolist(),
+                columns['isInstalled'].tolist(), coordinates, zip(*counts), columns['lastUpdate'].tolist(),
+                columns['prevSeen'].tolist()):
+            yield (code, name) + values + (installed, list(coords), columns['timestamp'], last_update, prev_seen)
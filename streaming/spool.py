@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Spool local durable entre le fetch et les sinks
+
+Chaque tick récupéré est d'abord ajouté à un journal local en ajout seul,
+découpé en segments (<dir>/<numéro>.seg). Un enregistrement est préfixé par
+sa longueur et son CRC32 ; une fin de segment tronquée (arrêt brutal) est
+coupée à la réouverture. Chaque sink est vidé par son propre thread
+(SpoolWorker) à son rythme, avec un curseur persistant : un sink en panne
+rejoue ses enregistrements quand il revient, sans ralentir les autres.
+
+L'espace disque est borné : au-delà de max_bytes, les segments les plus
+anciens sont supprimés, même s'ils n'ont pas encore été lus par tous les
+sinks (les enregistrements perdus sont signalés). Les segments lus par tous
+les sinks sont supprimés au fil de l'eau. La livraison est « au moins une
+fois » : après un arrêt, un sink peut recevoir de nouveau les enregistrements
+postérieurs à son dernier curseur validé.
+"""
+
+import collections
+import os
+import struct
+import threading
+import traceback
+import zlib
+
+# Longueur et CRC32 de la charge utile
+RECORD_HEADER = struct.Struct('<II')
+SEGMENT_SUFFIX = '.seg'
+
+
+def segment_name(segment):
+    return '%012d%s' % (segment, SEGMENT_SUFFIX)
+
+
+class Spool(object):
+    """Journal segmenté ; les positions sont des couples (segment, offset)"""
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, max_bytes=1024 * 1024 * 1024, fsync=True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.cond = threading.Condition()
+        self.cursors = {}
+        self.evicted = 0
+        os.makedirs(os.path.join(directory, 'cursors'), exist_ok=True)
+        self.segments = sorted(int(f[:-len(SEGMENT_SUFFIX)]) for f in os.listdir(directory)
+                               if f.endswith(SEGMENT_SUFFIX))
+        if not self.segments:
+            self.segments = [0]
+        self._recover(self.segments[-1])
+        self.file = open(self.path(self.segments[-1]), 'ab')
+
+    def path(self, segment):
+        return os.path.join(self.directory, segment_name(segment))
+
+    def _recover(self, segment):
+        """Coupe un éventuel enregistrement incomplet en fin de segment"""
+        path = self.path(segment)
+        if not os.path.exists(path):
+            return
+        valid = 0
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, crc = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                valid = f.tell()
+        if valid < os.path.getsize(path):
+            print('⚠️ Spool: truncating incomplete record at the end of ' + segment_name(segment))
+            with open(path, 'r+b') as f:
+                f.truncate(valid)
+
+    def append(self, payload):
+        """Ajoute un enregistrement (bytes) ; retourne sa position de fin"""
+        with self.cond:
+            if self.file.tell() >= self.segment_bytes:
+                self.file.close()
+                self.segments.append(self.segments[-1] + 1)
+                self.file = open(self.path(self.segments[-1]), 'ab')
+            self.file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            position = (self.segments[-1], self.file.tell())
+            self._enforce_limit()
+            self.cond.notify_all()
+            return position
+
+    def size(self):
+        return sum(os.path.getsize(self.path(s)) for s in self.segments if os.path.exists(self.path(s)))
+
+    def _enforce_limit(self):
+        while len(self.segments) > 1 and self.size() > self.max_bytes:
+            oldest = self.segments.pop(0)
+            lost = sum(1 for name, (segment, _) in self.cursors.items() if segment <= oldest)
+            os.remove(self.path(oldest))
+            self.evicted += 1
+            print('⚠️ Spool full: evicted ' + segment_name(oldest) +
+                  (' (not yet delivered to %d sinks)' % lost if lost else ''))
+
+    def _collect_garbage(self):
+        """Supprime les segments fermés que tous les sinks ont dépassés"""
+        if not self.cursors:
+            return
+        oldest_needed = min(segment for segment, _ in self.cursors.values())
+        while len(self.segments) > 1 and self.segments[0] < oldest_needed:
+            os.remove(self.path(self.segments.pop(0)))
+
+    def cursor_path(self, name):
+        return os.path.join(self.directory, 'cursors', name)
+
+    def load_cursor(self, name):
+        """Position validée d'un sink (début du spool pour un nouveau sink)"""
+        try:
+            with open(self.cursor_path(name)) as f:
+                segment, offset = f.read().split()
+                position = (int(segment), int(offset))
+        except (IOError, OSError, ValueError):
+            position = (self.segments[0], 0)
+        with self.cond:
+            self.cursors[name] = position
+        return position
+
+    def save_cursor(self, name, position):
+        tmp_path = self.cursor_path(name) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('%d %d' % position)
+        os.replace(tmp_path, self.cursor_path(name))
+        with self.cond:
+            self.cursors[name] = position
+            self._collect_garbage()
+
+    def read(self, position):
+        """Enregistrement suivant position : (payload, position suivante), ou None en fin de spool
+
+        Si le segment de position a été supprimé (spool plein), la lecture
+        reprend au plus ancien segment disponible.
+        """
+        segment, offset = position
+        while True:
+            with self.cond:
+                segments = list(self.segments)
+            if segment < segments[0]:
+                print('⚠️ Spool: records evicted before delivery, resuming at ' + segment_name(segments[0]))
+                segment, offset = segments[0], 0
+            try:
+                with open(self.path(segment), 'rb') as f:
+                    f.seek(offset)
+                    header = f.read(RECORD_HEADER.size)
+                    if len(header) == RECORD_HEADER.size:
+                        length, crc = RECORD_HEADER.unpack(header)
+                        payload = f.read(length)
+                        if len(payload) == length and zlib.crc32(payload) == crc:
+                            return payload, (segment, offset + RECORD_HEADER.size + length)
+            except (IOError, OSError):
+                with self.cond:
+                    segments = list(self.segments)
+                if segment < segments[0]:
+                    # Évincé entre-temps : la boucle repart du plus ancien segment
+                    continue
+                if segment >= segments[-1]:
+                    return None
+                segment, offset = segment + 1, 0
+                continue
+            # Fin du segment : passer au suivant s'il existe
+            if segment >= segments[-1]:
+                return None
+            segment, offset = segment + 1, 0
+
+    def wait(self, timeout):
+        with self.cond:
+            self.cond.wait(timeout)
+
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.file.close()
+            self.cond.notify_all()
+
+
+class SharedDecoder(object):
+    """Décode chaque enregistrement une seule fois pour tous les SpoolWorker
+
+    Les sinks lisent en général les mêmes enregistrements à quelques instants
+    d'écart : le résultat de decode(payload) est gardé pour les size derniers
+    enregistrements, identifiés par leur position de fin (unique dans le
+    spool). Un sink en retard au-delà décode de nouveau. Le résultat est
+    partagé entre les threads : les sinks ne le modifient pas.
+    """
+
+    def __init__(self, decode, size=16):
+        self.decode = decode
+        self.size = size
+        self.lock = threading.Lock()
+        self.records = collections.OrderedDict()
+        self.stats = {'decoded': 0, 'shared': 0}
+
+    def __call__(self, position, payload):
+        # Décodage sous le verrou : les autres sinks attendent ce résultat plutôt que de le recalculer
+        with self.lock:
+            if position in self.records:
+                self.stats['shared'] += 1
+                return self.records[position]
+            record = self.decode(payload)
+            self.stats['decoded'] += 1
+            self.records[position] = record
+            if len(self.records) > self.size:
+                self.records.popitem(last=False)
+            return record
+
+
+class SpoolWorker(object):
+    """Vide le spool vers un sink dans un thread dédié
+
+    handler(record) retourne True si l'enregistrement est durablement écrit
+    (le curseur est validé), False s'il est accepté mais seulement en mémoire
+    (tampon d'archive, écriture à retenter par le sink : le curseur sera
+    validé au prochain True). Une exception signifie que rien n'a été
+    appliqué : le même enregistrement est retenté avec un backoff exponentiel.
+    record est le payload, ou decoder(position, payload) si un décodeur
+    (SharedDecoder, commun à plusieurs workers) est fourni.
+    """
+
+    def __init__(self, spool, name, handler, backoff=1.0, max_backoff=60.0, decoder=None):
+        self.spool = spool
+        self.name = name
+        self.handler = handler
+        self.decoder = decoder
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.position = spool.load_cursor(name)
+        self.committed = self.position
+        self.stats = {'delivered': 0, 'retries': 0}
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='velib-spool-' + name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def commit(self):
+        """Valide la position lue (après un flush réussi du sink à l'arrêt, par exemple)"""
+        if self.position != self.committed:
+            self.spool.save_cursor(self.name, self.position)
+            self.committed = self.position
+
+    def _deliver(self, payload, position):
+        delay = self.backoff
+        while not self._stopping.is_set():
+            try:
+                if self.decoder is not None:
+                    return self.handler(self.decoder(position, payload))
+                return self.handler(payload)
+            except Exception as e:
+                self.stats['retries'] += 1
+                print('❌ Sink ' + self.name + ' failed, retrying in %.1fs: %s' % (delay, e))
+                if self.stats['retries'] == 1:
+                    traceback.print_exc()
+                self._stopping.wait(delay)
+                delay = min(2 * delay, self.max_backoff)
+        return None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            item = self.spool.read(self.position)
+            if item is None:
+                self.spool.wait(1.0)
+                continue
+            payload, position = item
+            durable = self._deliver(payload, position)
+            if durable is None:
+                # Arrêt pendant les retries : l'enregistrement sera rejoué au prochain démarrage
+                return
+            self.position = position
+            self.stats['delivered'] += 1
+            if durable:
+                self.commit()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.spool.wake()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
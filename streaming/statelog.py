@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Journal des changements d'état des stations (run-length encoding)
+
+Chaque observation est réduite à un état : OFFLINE (station non installée),
+EMPTY (aucun vélo), FULL (aucune place) ou AVAILABLE. Les observations
+consécutives identiques d'une station sont fusionnées en un intervalle
+(start, end, state) ; seuls les intervalles clos sont écrits, une station
+qui ne change pas ne produit rien. Un trou de plus de max_gap secondes entre
+deux observations clôt l'intervalle à la dernière observation.
+
+Même vocabulaire que le batch (build_state_intervals), qui reconstruit ces
+intervalles depuis l'archive et calcule les durées exactes vide / pleine /
+hors service.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+from pymongo.errors import BulkWriteError
+
+OFFLINE = 'OFFLINE'
+EMPTY = 'EMPTY'
+FULL = 'FULL'
+AVAILABLE = 'AVAILABLE'
+
+# Indice dans STATES = code stocké dans les tableaux (-1 : station jamais vue)
+STATES = (AVAILABLE, EMPTY, FULL, OFFLINE)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def station_states(columns):
+    """Code d'état de chaque station d'un tick (même priorité que le batch)"""
+    states = np.zeros(len(columns['stationCode']), dtype=np.int8)
+    states[columns['numDocksAvailable'] == 0] = STATES.index(FULL)
+    states[columns['numBikesAvailable'] == 0] = STATES.index(EMPTY)
+    states[~columns['isInstalled']] = STATES.index(OFFLINE)
+    return states
+
+
+class StateLog(object):
+    """Intervalle d'état en cours de chaque station, rangé dans des tableaux NumPy"""
+
+    def __init__(self, max_gap=600):
+        self.max_gap = float(max_gap)
+        self.index = {}
+        self.codes = []
+        self.names = []
+        self._allocate(0)
+
+    def _allocate(self, size):
+        self.state = np.full(size, -1, dtype=np.int8)
+        self.start = np.zeros(size, dtype=np.float64)
+        self.last_seen = np.zeros(size, dtype=np.float64)
+        self.observations = np.zeros(size, dtype=np.int64)
+
+    def _grow(self, size):
+        old = dict((name, getattr(self, name)) for name in ('state', 'start', 'last_seen', 'observations'))
+        self._allocate(max(size, 2 * len(old['state'])))
+        for name, array in old.items():
+            getattr(self, name)[:len(array)] = array
+
+    def positions(self, codes, names):
+        """Indices des stations dans les tableaux (les nouvelles stations sont ajoutées)"""
+        positions = np.empty(len(codes), dtype=np.int64)
+        for i, code in enumerate(codes):
+            position = self.index.get(code)
+            if position is None:
+                position = self.index[code] = len(self.codes)
+                self.codes.append(code)
+                self.names.append(names[i])
+            positions[i] = position
+        if len(self.codes) > len(self.state):
+            self._grow(len(self.codes))
+        return positions
+
+    def update(self, columns):
+        """Ajoute un tick ; retourne les intervalles clos par ce tick"""
+        when = datetime.fromisoformat(columns['timestamp'])
+        now = (when - EPOCH).total_seconds()
+        idx = self.positions(columns['stationCode'].tolist(), columns['name'].tolist())
+        states = station_states(columns)
+
+        previous = self.state[idx]
+        seen = previous >= 0
+        gap = seen & (now - self.last_seen[idx] > self.max_gap)
+        changed = seen & (gap | (states != previous))
+
+        closing = idx[changed]
+        # Fin de l'intervalle : cette observation, ou la dernière avant le trou
+        ends = np.where(gap[changed], self.last_seen[closing], now)
+        intervals = self._intervals(closing, ends)
+
+        restart = idx[changed | ~seen]
+        self.start[restart] = now
+        self.observations[restart] = 0
+        self.state[idx] = states
+        self.last_seen[idx] = now
+        self.observations[idx] += 1
+        return intervals
+
+    def _intervals(self, positions, ends):
+        intervals = []
+        for p, end in zip(positions.tolist(), ends.tolist()):
+            start = float(self.start[p])
+            intervals.append({
+                'stationCode': self.codes[p],
+                'name': self.names[p],
+                'state': STATES[self.state[p]],
+                'start': EPOCH + timedelta(seconds=start),
+                'end': EPOCH + timedelta(seconds=end),
+                'durationS': end - start,
+                'observations': int(self.observations[p]),
+            })
+        return intervals
+
+    def close(self):
+        """Clôt les intervalles en cours à la dernière observation (arrêt du pipeline)"""
+        positions = np.nonzero(self.state[:len(self.codes)] >= 0)[0]
+        intervals = self._intervals(positions, self.last_seen[positions])
+        self.state[positions] = -1
+        return intervals
+
+
+class StateLogWriter(object):
+    """Insère les intervalles clos dans MongoDB (TTL sur end)
+
+    Les intervalles dont l'insertion échoue (serveur injoignable) sont
+    conservés et l'exception est propagée ; un tick réécrit après l'erreur
+    (même timestamp) ne met pas le journal à jour une seconde fois.
+    """
+
+    def __init__(self, collection, ttl_seconds, max_gap=600):
+        self.collection = collection
+        self.log = StateLog(max_gap)
+        self.pending = []
+        self.last_tick = None
+        collection.create_index([('stationCode', 1), ('start', -1)])
+        collection.create_index('end', expireAfterSeconds=int(ttl_seconds))
+
+    def write(self, columns):
+        """Met à jour le journal avec un tick ; retourne le nombre d'intervalles insérés"""
+        if columns['timestamp'] != self.last_tick:
+            self.pending.extend(self.log.update(columns))
+            self.last_tick = columns['timestamp']
+        return self._insert_pending()
+
+    def _insert_pending(self):
+        if not self.pending:
+            return 0
+        try:
+            self.collection.insert_many(self.pending, ordered=False)
+        except BulkWriteError as e:
+            # Insertion partielle : les documents en erreur ne sont pas renvoyés
+            print('❌ MongoDB state log error:', len(e.details.get('writeErrors', [])), 'intervals rejected')
+            del self.pending[:]
+            return 0
+        inserted = len(self.pending)
+        del self.pending[:]
+        return inserted
+
+    def flush(self):
+        """Insère les intervalles en cours (arrêt du pipeline)"""
+        self.pending.extend(self.log.close())
+        return self._insert_pending()
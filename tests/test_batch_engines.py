@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Parité des moteurs batch spark et duckdb (benchmarks/batch_engines.py) sur
+quelques stations et quelques heures d'historique synthétique
+
+Ignoré sans pyspark ni Java. Usage : python -m pytest -q tests
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+pytest.importorskip('pyspark')
+if not shutil.which('java') and not os.environ.get('JAVA_HOME'):
+    pytest.skip('Java is required by Spark', allow_module_level=True)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+from batch_engines import OUTPUTS, compare_output, run_duckdb, run_spark  # noqa: E402
+from generator import SyntheticFeed, write_history  # noqa: E402
+
+TOLERANCE = 1e-6
+HLL_TOLERANCE = 0.02
+
+
+def test_spark_and_duckdb_outputs_match(tmp_path):
+    root = str(tmp_path / 'archive')
+    # Lectures répétées et trous de données : archive dédoublonnée comme par le streaming
+    feed = SyntheticFeed(20, refresh_rate=0.8, dropout_rate=0.05)
+    write_history(root, feed, days=0.25, period_s=300, dedup=True)
+    spark_output, duckdb_output = str(tmp_path / 'spark'), str(tmp_path / 'duckdb')
+    run_duckdb(root, duckdb_output)
+    run_spark(root, spark_output)
+
+    mismatches = {}
+    for name, keys in OUTPUTS:
+        rows, differences = compare_output(os.path.join(spark_output, name), os.path.join(duckdb_output, name),
+                                           keys, TOLERANCE, HLL_TOLERANCE)
+        assert rows, name + ' is empty'
+        if differences:
+            mismatches[name] = differences
+    assert not mismatches
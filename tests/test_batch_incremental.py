@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Mode incrémental du batch Spark : un run incrémental sur des données déjà traitées
+ne doit rien recompter (watermark sur le tick, pas sur le temps des lectures)
+
+Ignoré sans pyspark ni Java. Usage : python -m pytest -q tests
+"""
+
+import datetime
+import os
+import shutil
+import sys
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+pytest.importorskip('pyspark')
+if not shutil.which('java') and not os.environ.get('JAVA_HOME'):
+    pytest.skip('Java is required by Spark', allow_module_level=True)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+from batch_engines import read_output, run_spark  # noqa: E402
+from generator import SyntheticFeed, write_history  # noqa: E402
+
+PERIOD_S = 1800
+
+
+class LaggingFeed(SyntheticFeed):
+    """Lectures publiées deux ticks avant leur relevé (lastUpdate bien antérieur au tick)"""
+
+    def tick(self, timestamp=None):
+        when = datetime.datetime.fromisoformat(timestamp) - datetime.timedelta(seconds=2 * PERIOD_S)
+        return SyntheticFeed.tick(self, when.isoformat())
+
+
+def daily_stats(output):
+    _, table = read_output(os.path.join(output, 'daily_stats'))
+    return table.sort_values(['stationCode', 'date']).reset_index(drop=True)
+
+
+def test_incremental_rerun_counts_nothing_twice(tmp_path):
+    root, output = str(tmp_path / 'archive'), str(tmp_path / 'output')
+    write_history(root, LaggingFeed(15), days=0.25, period_s=PERIOD_S)
+
+    run_spark(root, output)
+    expected = daily_stats(output)
+    for _ in range(2):
+        run_spark(root, output, incremental=True)
+        assert_frame_equal(daily_stats(output), expected)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+ContractFetcher contre le faux serveur JCDecaux (benchmarks/fake_jcdecaux.py) :
+retries sur 503, réutilisation du payload sur 304, isolation d'un contrat en erreur
+
+Usage : python -m pytest -q tests
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'streaming'))
+
+from fake_jcdecaux import FakeJCDecauxAPI  # noqa: E402
+from fetcher import ContractFetcher  # noqa: E402
+
+STATIONS = 20
+
+
+@pytest.fixture
+def api():
+    api = FakeJCDecauxAPI(stations_per_contract=STATIONS, latency=0).start()
+    yield api
+    api.stop()
+
+
+@pytest.fixture
+def make_fetcher(api):
+    fetchers = []
+
+    def make(contracts, **kwargs):
+        kwargs.setdefault('backoff', 0.01)
+        fetcher = ContractFetcher(contracts, 'test', api.base_url, timeout=5.0, **kwargs)
+        fetchers.append(fetcher)
+        return fetcher
+
+    yield make
+    for fetcher in fetchers:
+        fetcher.close()
+
+
+def test_fetch_all_contracts(make_fetcher):
+    records, stats = make_fetcher(['lyon', 'paris']).fetch()
+    assert len(records) == 2 * STATIONS
+    assert set(r['contractName'] for r in records) == {'lyon', 'paris'}
+    assert all(info['status'] == 'ok' and info['attempts'] == 1 for info in stats.values())
+
+
+def test_retry_after_transient_errors(api, make_fetcher):
+    api.failures['lyon'] = 2
+    records, stats = make_fetcher(['lyon'], retries=3).fetch()
+    assert stats['lyon']['status'] == 'ok'
+    assert stats['lyon']['attempts'] == 3
+    assert len(records) == STATIONS
+
+
+def test_retries_exhausted(api, make_fetcher):
+    api.failures['lyon'] = 5
+    records, stats = make_fetcher(['lyon', 'paris'], retries=2).fetch()
+    assert stats['lyon']['status'] == 'error'
+    assert stats['lyon']['attempts'] == 3
+    assert stats['paris']['status'] == 'ok'
+    assert len(records) == STATIONS
+
+
+def test_not_modified_reuses_last_payload(make_fetcher):
+    fetcher = make_fetcher(['lyon'])
+    first, _ = fetcher.fetch()
+    records, stats = fetcher.fetch()
+    assert stats['lyon']['status'] == 'not_modified'
+    assert stats['lyon']['bytes'] == 0
+    assert records == first
+
+
+def test_invalid_json_isolated_to_its_contract(api, make_fetcher):
+    fetcher = make_fetcher(['lyon', 'paris'])
+    fetcher.fetch()
+
+    # Réponse tronquée pour lyon : le dernier payload connu n'est pas réutilisé
+    api.malformed.add('lyon')
+    records, stats = fetcher.fetch()
+    assert stats['lyon']['status'] == 'error'
+    assert stats['lyon']['stations'] == 0
+    assert stats['lyon']['attempts'] == 1
+    assert stats['paris']['status'] == 'not_modified'
+    assert len(records) == STATIONS
+    assert set(r['contractName'] for r in records) == {'paris'}
+
+    # Serveur rétabli : l'ETag gardé de la dernière réponse valide donne un 304
+    api.malformed.discard('lyon')
+    records, stats = fetcher.fetch()
+    assert stats['lyon']['status'] == 'not_modified'
+    assert len(records) == 2 * STATIONS
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+ForecastModel.predict : profil interpolé entre les milieux des heures et
+décroissance AR(1) de l'écart, deviation * phi ** (minutes / 60)
+
+Usage : python -m pytest -q tests
+"""
+
+import datetime
+import os
+import sys
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'streaming'))
+
+from forecast import HOURS_PER_WEEK, ForecastModel  # noqa: E402
+
+# Lundi 8h30 : milieu de l'heure 8 de la semaine, le profil vaut exactement profile[8]
+WHEN = datetime.datetime(2024, 1, 15, 8, 30)
+
+
+def make_model(phi=0.5, capacity=30):
+    profile = [10 + 0.5 * h for h in range(HOURS_PER_WEEK)]
+    return ForecastModel(['42'], [profile], [phi], [capacity])
+
+
+def test_predict_against_baseline_and_decay():
+    forecast = make_model().predict(['42'], [20], WHEN)
+
+    deviation = 20 - 14.0
+    expected = [
+        0.75 * 14.0 + 0.25 * 14.5 + deviation * 0.5 ** 0.25,  # 8h45
+        0.5 * 14.0 + 0.5 * 14.5 + deviation * 0.5 ** 0.5,  # 9h00
+        14.5 + deviation * 0.5,  # 9h30
+    ]
+    assert forecast.shape == (1, 3)
+    assert np.allclose(forecast[0], expected)
+
+
+def test_predict_clips_to_capacity_and_keeps_unknown_stations():
+    forecast = make_model(phi=1.0, capacity=18).predict(['42', 'unknown'], [20, 7], WHEN)
+
+    # phi = 1 : l'écart persiste, la prévision est bornée par la capacité
+    assert np.allclose(forecast[0], [18, 18, 18])
+    assert np.allclose(forecast[1], [7, 7, 7])
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Spool et SpoolWorker : chaque sink reçoit tous les enregistrements, décodés
+une seule fois quand les workers partagent un SharedDecoder
+
+Usage : python -m pytest -q tests
+"""
+
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'streaming'))
+
+from spool import SharedDecoder, Spool, SpoolWorker  # noqa: E402
+
+RECORDS = 5
+
+
+def test_shared_decoder_decodes_each_record_once(tmp_path):
+    spool = Spool(str(tmp_path), fsync=False)
+    for i in range(RECORDS):
+        spool.append(str(i).encode('utf-8'))
+
+    decoded = []
+
+    def decode(payload):
+        decoded.append(payload)
+        return int(payload.decode('utf-8'))
+
+    decoder = SharedDecoder(decode)
+    received = dict((name, []) for name in ('mongo', 'history', 'archive'))
+    workers = [SpoolWorker(spool, name, lambda record, name=name: received[name].append(record) or True,
+                           decoder=decoder).start() for name in received]
+    deadline = time.time() + 10
+    while any(len(r) < RECORDS for r in received.values()) and time.time() < deadline:
+        time.sleep(0.01)
+    for worker in workers:
+        worker.stop()
+    spool.close()
+
+    assert all(r == list(range(RECORDS)) for r in received.values())
+    assert len(decoded) == RECORDS
+    assert decoder.stats == {'decoded': RECORDS, 'shared': 2 * RECORDS}